@@ -0,0 +1,84 @@
+'''
+Micro-benchmarks for the Jenkins job generator.
+
+Usage:
+    python benchmarks/jenkins_generator.py [rows]
+'''
+import sys
+import timeit
+from textwrap import dedent
+
+from jobs_done10.generators.jenkins import GetJobsFromFile, JenkinsXmlJobGenerator
+from jobs_done10.repository import Repository
+
+
+REPOSITORY = Repository(url='https://example.com/space.git', branch='milky_way')
+
+
+def GetJobsDoneFile(rows):
+    '''
+    :return unicode:
+        A jobs_done file with a matrix of `rows` rows (rounded down to a multiple of 10).
+    '''
+    planets = '\n'.join('    - planet%d' % i for i in range(max(1, rows // 10)))
+    moons = '\n'.join('    - moon%d' % i for i in range(10))
+    return dedent(
+        '''
+        junit_patterns:
+        - "tests-{planet}-{moon}.xml"
+
+        build_batch_commands:
+        - "python -m pytest --junitxml=tests-{planet}-{moon}.xml"
+
+        email_notification:
+          recipients: space@example.com
+          notify_every_build: true
+
+        timeout: "60"
+        timestamps: "true"
+
+        matrix:
+          planet:
+        %s
+          moon:
+        %s
+        '''
+    ) % (planets, moons)
+
+
+def BenchmarkReset(rows):
+    generator = JenkinsXmlJobGenerator()
+    generator.SetRepository(REPOSITORY)
+
+    def Reset():
+        generator.Reset()
+
+    def BuildBaseXml():
+        generator._BuildBaseXml()
+
+    for name, func in [('Reset (template copy)', Reset), ('Reset (rebuild, legacy)', BuildBaseXml)]:
+        seconds = min(timeit.repeat(func, number=rows, repeat=5))
+        print('%-30s %8.1f us/job' % (name, seconds / rows * 1e6))
+
+
+def BenchmarkGetJobsFromFile(rows):
+    from jobs_done10.jobs_done_job import JobsDoneJob
+
+    contents = GetJobsDoneFile(rows)
+
+    def GetJobs():
+        JobsDoneJob.ClearCache()
+        jobs = GetJobsFromFile(REPOSITORY, contents)
+        for job in jobs:
+            job.xml
+        return jobs
+
+    jobs = GetJobs()
+    seconds = min(timeit.repeat(GetJobs, number=1, repeat=3))
+    print('%-30s %8.1f us/job (%d jobs)' % ('GetJobsFromFile', seconds / len(jobs) * 1e6, len(jobs)))
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    BenchmarkReset(rows)
+    BenchmarkGetJobsFromFile(rows)
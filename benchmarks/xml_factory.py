@@ -0,0 +1,167 @@
+'''
+Micro-benchmarks for XmlFactory serialization and conversion to dict/JSON, using the xml of
+generated Jenkins jobs.
+
+Usage:
+    python benchmarks/xml_factory.py [rows]
+'''
+import copy
+import json
+import sys
+import timeit
+from io import StringIO
+from itertools import chain
+
+from jenkins_generator import REPOSITORY, GetJobsDoneFile
+from jobs_done10.generators.jenkins import JenkinsXmlJobGenerator
+from jobs_done10.job_generator import JobGeneratorConfigurator
+from jobs_done10.jobs_done_job import JobsDoneJob
+from jobs_done10.xml_factory import XmlFactory
+
+
+def LegacyWritePrettyXMLElement(oss, element, indent=0):
+    '''
+    The recursive implementation of WritePrettyXMLElement used up to 1.x, for comparison.
+    '''
+    from xml.sax.saxutils import escape
+
+    INDENT = '  '
+
+    oss.write(INDENT * indent + '<%s' % element.tag)
+    for i_name, i_value in sorted(element.attrib.items()):
+        oss.write(' %s="%s"' % (i_name, escape(i_value)))
+
+    if len(element) == 0 and element.text is None:
+        oss.write('/>')
+        return
+
+    oss.write('>')
+
+    for i_element in element:
+        oss.write('\n')
+        LegacyWritePrettyXMLElement(oss, i_element, indent + 1)
+
+    if element.text is not None:
+        oss.write(escape(element.text, {'\r': '&#xd;'}))
+
+    if element.text is None:
+        oss.write('\n' + INDENT * indent)
+    oss.write('</%s>' % element.tag)
+
+
+def LegacyGetContents(factory):
+    oss = StringIO()
+    LegacyWritePrettyXMLElement(oss, factory.root)
+    return oss.getvalue()
+
+
+def LegacyAsDict(factory):
+    '''
+    The recursive implementation of XmlFactory.AsDict used up to 1.x, for comparison (with
+    `elem.getchildren()`, removed in Python 3.9, replaced by `list(elem)`).
+    '''
+    def _elem2list(elem, return_children=False):
+        block = {}
+
+        children = list(elem)
+
+        if children:
+            cur = list(map(_elem2list, children))
+
+            scalar = False
+            try:
+                if elem[0].tag != elem[1].tag:
+                    cur = dict(chain(*(d.items() for d in cur)))
+                else:
+                    scalar = True
+            except Exception:
+                scalar = True
+
+            if scalar:
+                if len(cur) > 1:
+                    cur = {elem[0].tag: [list(e.values())[0] for e in cur if list(e.values())[0] is not None]}
+                else:
+                    cur = {elem[0].tag: list(cur[0].values())[0] }
+
+            block[elem.tag] = cur
+            if return_children:
+                return cur
+        else:
+            val = None
+            if elem.text:
+                val = elem.text.strip()
+                val = val if len(val) > 0 else None
+
+            block[elem.tag] = val
+
+        return block
+
+    return _elem2list(factory.root, return_children=True)
+
+
+def GetJobFactories(rows):
+    '''
+    :return list(XmlFactory):
+        The xml of the Jenkins jobs generated for a jobs_done file with `rows` rows.
+    '''
+    generator = JenkinsXmlJobGenerator()
+    result = []
+    for jobs_done_job in JobsDoneJob.IterFromYAML(GetJobsDoneFile(rows), REPOSITORY):
+        JobGeneratorConfigurator.Configure(generator, jobs_done_job)
+        result.append(XmlFactory(copy.deepcopy(generator.xml.root)))
+    return result
+
+
+def BenchmarkGetContents(rows):
+    factories = GetJobFactories(rows)
+    for factory in factories:
+        assert factory.GetContents() == LegacyGetContents(factory)
+
+    def GetContents():
+        for factory in factories:
+            factory.GetContents()
+
+    def Legacy():
+        for factory in factories:
+            LegacyGetContents(factory)
+
+    for name, func in [('GetContents', GetContents), ('GetContents (legacy)', Legacy)]:
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print('%-30s %8.1f us/job' % (name, seconds / len(factories) * 1e6))
+
+
+def BenchmarkAsJson(rows):
+    factories = GetJobFactories(rows)
+
+    # A single wide node, like the parameters of a big job
+    wide = XmlFactory('project')
+    for i in range(rows * 20):
+        wide['properties/parameterDefinitions/hudson.model.StringParameterDefinition+/name'] = i
+    factories.append(wide)
+
+    for factory in factories:
+        assert factory.AsDict() == LegacyAsDict(factory)
+        assert factory.AsJson() == json.dumps(LegacyAsDict(factory))
+
+    for name, func in [
+            ('AsDict', lambda: [factory.AsDict() for factory in factories]),
+            ('AsDict (legacy)', lambda: [LegacyAsDict(factory) for factory in factories]),
+            ('AsJson', lambda: [factory.AsJson() for factory in factories]),
+            ('AsJson (legacy)', lambda: [json.dumps(LegacyAsDict(factory)) for factory in factories]),
+        ]:
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print('%-30s %8.1f us/job' % (name, seconds / len(factories) * 1e6))
+
+
+def BenchmarkDeepTree(depth):
+    factory = XmlFactory('root')
+    factory['/'.join(['element'] * depth)] = 'deep'
+    contents = factory.GetContents()
+    print('%-30s %8d chars (depth %d)' % ('Deep tree', len(contents), depth))
+
+
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    BenchmarkGetContents(rows)
+    BenchmarkAsJson(rows)
+    BenchmarkDeepTree(sys.getrecursionlimit() * 2)
@@ -0,0 +1,61 @@
+import pytest
+
+from jobs_done10.common import LruCache, SQLiteConnection
+
+
+def testLruCacheEviction():
+    cache = LruCache(max_size=2)
+    cache.Set('a', 1)
+    cache.Set('b', 2)
+
+    # Using 'a' makes 'b' the least recently used entry
+    assert cache.Get('a') == 1
+    cache.Set('c', 3)
+    assert len(cache) == 2
+    assert cache.Get('b') is None
+    assert cache.Get('a') == 1
+    assert cache.Get('c') == 3
+
+    cache.Invalidate('a')
+    assert cache.Get('a', 'missing') == 'missing'
+
+    cache.Clear()
+    assert len(cache) == 0
+
+
+def testLruCacheTimeToLive():
+    now = [0.0]
+    cache = LruCache(ttl=10, timer=lambda: now[0])
+    cache.Set('a', 1)
+
+    now[0] = 10.0
+    assert cache.Get('a') == 1
+
+    now[0] = 10.5
+    assert cache.Get('a') is None
+    assert len(cache) == 0
+
+
+def testSQLiteConnection(tmpdir):
+    filename = str(tmpdir / 'database.sqlite')
+    with SQLiteConnection(filename) as connection:
+        connection.execute('CREATE TABLE entries (value TEXT)')
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute("INSERT INTO entries VALUES ('committed')")
+
+    # Transactions are rolled back on errors
+    with pytest.raises(ZeroDivisionError):
+        with SQLiteConnection(filename) as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute("INSERT INTO entries VALUES ('rolled back')")
+            1 / 0
+
+    with SQLiteConnection(filename) as connection:
+        assert connection.execute('SELECT value FROM entries').fetchall() == [('committed',)]
+        connection.execute('BEGIN IMMEDIATE')
+
+    # The connection is closed on exit (along with its transaction)
+    with pytest.raises(Exception, match='closed'):
+        connection.execute('SELECT value FROM entries')
+    with SQLiteConnection(filename, timeout=0) as other_connection:
+        other_connection.execute('BEGIN IMMEDIATE')
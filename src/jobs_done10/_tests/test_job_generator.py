@@ -11,6 +11,8 @@ from jobs_done10.repository import Repository
 
 
 def testJobGeneratorConfigurator():
+    batch_commands = []
+
     class MyGenerator(object):
 
         def SetRepository(self, repository):
@@ -21,7 +23,9 @@ def testJobGeneratorConfigurator():
             assert matrix_row == {'id':1}
 
         def SetBuildBatchCommands(self, commands):
-            assert commands == ['command']
+            # Called through the class function (.. seealso:: JobGeneratorConfigurator._GetSetters),
+            # so calls are not counted by ExpectedCalls
+            batch_commands.append(commands)
 
         def Reset(self):
             pass
@@ -34,13 +38,15 @@ def testJobGeneratorConfigurator():
     generator = MyGenerator()
 
     # Test basic calls
-    with ExpectedCalls(generator, Reset=1, SetRepository=1, SetMatrix=1, SetBuildBatchCommands=0):
+    with ExpectedCalls(generator, Reset=1, SetRepository=1, SetMatrix=1):
         JobGeneratorConfigurator.Configure(generator, jobs_done_job)
+    assert batch_commands == []
 
     # Set some more values to jobs_done_job, and make sure it is called
     jobs_done_job.build_batch_commands = ['command']
-    with ExpectedCalls(generator, Reset=1, SetRepository=1, SetMatrix=1, SetBuildBatchCommands=1):
+    with ExpectedCalls(generator, Reset=1, SetRepository=1, SetMatrix=1):
         JobGeneratorConfigurator.Configure(generator, jobs_done_job)
+    assert batch_commands == [['command']]
 
     # Try calling a missing option
     jobs_done_job.boosttest_patterns = 'patterns'
@@ -49,6 +55,23 @@ def testJobGeneratorConfigurator():
 
 
 
+def testRegisterGenerator():
+    from jobs_done10.generators.jenkins import JenkinsXmlJobGenerator
+
+    # Generators handling all options can be registered
+    assert JobGeneratorConfigurator.Register(JenkinsXmlJobGenerator) is JenkinsXmlJobGenerator
+
+    # Missing functions are reported as soon as the class is defined
+    with pytest.raises(JobGeneratorAttributeError) as e:
+        @JobGeneratorConfigurator.Register
+        class IncompleteGenerator(object):
+            def SetAdditionalRepositories(self, repositories):
+                pass
+    assert 'IncompleteGenerator' in str(e.value)
+    assert 'SetAuthToken' in str(e.value)
+
+
+
 #===================================================================================================
 # ExpectedCalls
 #===================================================================================================
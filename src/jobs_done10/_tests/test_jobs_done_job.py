@@ -4,7 +4,7 @@ from textwrap import dedent
 
 import pytest
 
-from jobs_done10.jobs_done_job import (JobsDoneFileTypeError, JobsDoneJob,
+from jobs_done10.jobs_done_job import (JobsDoneFileTypeError, JobsDoneJob, LoadYAML,
     UnknownJobsDoneFileOption, UnmatchableConditionError)
 from jobs_done10.repository import Repository
 
@@ -640,6 +640,42 @@ def testUnmatchableSubCondition():
     assert e.value.option == 'planet-pluto:shallow'
 
 
+def testUnmatchableCombinedConditions():
+    '''
+    Conditions are checked for each matrix variable: all conditions on a variable must be matched by
+    the same value (or its aliases), while different variables can be matched by any combination.
+    '''
+    base_contents = dedent(
+        '''
+        matrix:
+            planet:
+            - earth,terra
+            - mars
+            moon:
+            - europa
+            - ganymede
+        '''
+    )
+
+    def Create(key):
+        return JobsDoneJob.CreateFromYAML(base_contents + f'{key}: true\n', repository=_REPOSITORY)
+
+    Create('planet-terra:moon-europa:branch-doesnt_matter:ignore_unmatchable')
+    Create('planet-earth:planet-terra:ignore_unmatchable')
+    Create('planet-.*:planet-mars:moon-gany.*:ignore_unmatchable')
+
+    for key in [
+        'planet-mars:planet-terra:ignore_unmatchable',
+        'planet-earth:moon-io:ignore_unmatchable',
+    ]:
+        with pytest.raises(UnmatchableConditionError) as e:
+            Create(key)
+        assert e.value.option == key
+
+    with pytest.raises(KeyError):
+        Create('star-sun:ignore_unmatchable')
+
+
 def testStripFile():
     '''
     Asserts that we can handle empty spaces and tabs in .yaml files, without having parse errors
@@ -652,3 +688,322 @@ def testStripFile():
     )
     contents += '\t'
     JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)
+
+
+def testCreateFromYAMLCache(mocker):
+    JobsDoneJob.ClearCache()
+    contents = dedent(
+        '''
+        junit_patterns:
+        - "{planet}-{branch}.xml"
+
+        matrix:
+            planet:
+            - earth
+            - mars
+        '''
+    )
+    create_spy = mocker.spy(JobsDoneJob, '_CreateFromYAML')
+
+    jobs = JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)
+    assert [job.junit_patterns for job in jobs] == [['earth-milky_way.xml'], ['mars-milky_way.xml']]
+
+    # Cached jobs are returned as they are, without copies
+    cached_jobs = JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)
+    assert cached_jobs == jobs
+    assert all(cached_job is job for cached_job, job in zip(cached_jobs, jobs))
+    assert create_spy.call_count == 1
+
+    # Jobs depend on the repository/branch
+    other_repository = Repository(url='https://space.git', branch='andromeda')
+    jobs = JobsDoneJob.CreateFromYAML(contents, repository=other_repository)
+    assert [job.junit_patterns for job in jobs] == [['earth-andromeda.xml'], ['mars-andromeda.xml']]
+    assert create_spy.call_count == 2
+
+    JobsDoneJob.ClearCache()
+    JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)
+    assert create_spy.call_count == 3
+
+
+def testMatchConditions():
+    facts = {'planet': ['terra', 'earth'], 'moon': JobsDoneJob._MATCH_ANY}
+    match = lambda conditions: JobsDoneJob._MatchConditions(conditions, facts, branch=['master'])
+
+    assert match(['planet-terra'])
+    assert match(['planet-terra', 'branch-master'])
+    assert match(['planet-earth', 'branch-master'])
+    assert match(['planet-ear.*', 'moon-doesnt_matter'])
+    assert match([])
+
+    assert not match(['planet-mars'])
+    assert not match(['planet-earth', 'branch-release'])
+
+    with pytest.raises(KeyError):
+        match(['star-sun'])
+
+    # Compiled conditions are shared by keys with the same conditions
+    conditions, compiled_conditions, option_name = JobsDoneJob._ParseConditionalKey(
+        'planet-earth:branch-master:junit_patterns')
+    assert conditions == ['planet-earth', 'branch-master']
+    assert option_name == 'junit_patterns'
+    assert compiled_conditions[0] is JobsDoneJob._ParseConditionalKey('planet-earth:shallow')[1][0]
+    assert JobsDoneJob._MatchCompiledConditions(compiled_conditions, dict(facts, branch=['master']))
+
+
+def testIterFromYAML():
+    JobsDoneJob.ClearCache()
+    contents = dedent(
+        '''
+        junit_patterns:
+        - "{planet}-{moon}.xml"
+
+        planet-mars:exclude: "yes"
+
+        matrix:
+            planet:
+            - earth
+            - mars
+            moon:
+            - europa
+            - ganymede
+        '''
+    )
+    jobs = JobsDoneJob.IterFromYAML(contents, repository=_REPOSITORY)
+    assert not isinstance(jobs, list)
+    assert next(jobs).junit_patterns == ['earth-europa.xml']
+    assert next(jobs).junit_patterns == ['earth-ganymede.xml']
+    assert list(jobs) == []
+
+    # Same jobs as CreateFromYAML, also when they are cached
+    expected = [job.junit_patterns for job in JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)]
+    jobs = JobsDoneJob.IterFromYAML(contents, repository=_REPOSITORY)
+    assert [job.junit_patterns for job in jobs] == expected
+
+    assert list(JobsDoneJob.IterFromYAML(None, repository=_REPOSITORY)) == []
+
+    # Errors are raised when iteration starts
+    jobs = JobsDoneJob.IterFromYAML('unknown_option: 1', repository=_REPOSITORY)
+    with pytest.raises(UnknownJobsDoneFileOption):
+        next(jobs)
+
+
+def testCompileYAMLData():
+    data = {
+        'constant': ['a', 'b', {'c': 'd'}],
+        'formatted': ['a', '{planet}', {'{planet}': 'd'}],
+        'conditional': {'planet-earth:shallow': 'true', 'list': ['a']},
+        'escaped': '{{planet}}',
+    }
+    constant, template = JobsDoneJob._CompileYAMLData(data)
+    assert not constant
+
+    formatted = template({'planet': 'earth'})
+    assert formatted == {
+        'constant': ['a', 'b', {'c': 'd'}],
+        'formatted': ['a', 'earth', {'earth': 'd'}],
+        'conditional': {'planet-earth:shallow': 'true', 'list': ['a']},
+        'escaped': '{planet}',
+    }
+    # Constant data is shared, data changed for each row is not
+    other = template({'planet': 'mars'})
+    assert formatted['constant'] is other['constant'] is data['constant']
+    assert formatted['formatted'] is not other['formatted']
+    assert formatted['conditional'] is not other['conditional']
+    assert formatted['conditional']['list'] is other['conditional']['list']
+
+    assert JobsDoneJob._CompileYAMLData(data['constant']) == (True, data['constant'])
+    with pytest.raises(KeyError):
+        template({})
+
+
+def testExcludedRowsAreNotExpanded(mocker):
+    JobsDoneJob.ClearCache()
+    contents = dedent(
+        '''
+        junit_patterns:
+        - "{planet}-{moon}.xml"
+
+        exclude: "yes"
+        planet-earth:moon-europa:exclude: "no"
+        moon-ganymede:branch_patterns:
+        - "master"
+
+        matrix:
+            planet: [mercury, venus, earth, mars]
+            moon: [europa, ganymede, io]
+        '''
+    )
+    resolve_spy = mocker.spy(JobsDoneJob, '_ResolveConditions')
+
+    jobs = JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)
+    assert [job.matrix_row for job in jobs] == [{'planet': 'earth', 'moon': 'europa'}]
+    assert jobs[0].exclude == 'no'
+    assert jobs[0].junit_patterns == ['earth-europa.xml']
+
+    # Conditions of `exclude` and `branch_patterns` are resolved for each of the 12 rows, but only
+    # the surviving row is fully expanded (2 dicts: the options and the matrix)
+    assert resolve_spy.call_count == 12 + 2
+
+
+def testExcludedRowsAreNotValidated():
+    JobsDoneJob.ClearCache()
+    contents = dedent(
+        '''
+        matrix:
+            platform: [linux, windows]
+            slave: [slave1, slave2]
+
+        platform-linux:display_name: "Linux job"
+        slave-slave2:display_name: "slave2 job"
+        '''
+    )
+    with pytest.raises(ValueError):
+        JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)
+
+    # Errors which only happen while expanding the options of excluded rows are not raised, since
+    # excluded rows are not expanded: here, conditions are only ambiguous for linux-slave2
+    jobs = JobsDoneJob.CreateFromYAML(
+        contents + 'platform-linux:exclude: "yes"\n', repository=_REPOSITORY)
+    assert [job.matrix_row for job in jobs] == [
+        {'platform': 'windows', 'slave': 'slave1'},
+        {'platform': 'windows', 'slave': 'slave2'},
+    ]
+    assert [job.display_name for job in jobs] == [None, 'slave2 job']
+
+    # The same goes for unknown variables, as long as every row is excluded
+    contents = dedent(
+        '''
+        matrix:
+            platform: [linux, windows]
+
+        display_name: "{unknown}"
+        '''
+    )
+    with pytest.raises(KeyError):
+        JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)
+    assert JobsDoneJob.CreateFromYAML(contents + 'exclude: "yes"\n', repository=_REPOSITORY) == []
+
+
+def testBranchPatternsShortCircuit(mocker):
+    JobsDoneJob.ClearCache()
+    matrix_spy = mocker.spy(JobsDoneJob._MatrixRow, 'IterFromDict')
+
+    # Branches not matching the top-level patterns create no jobs, without even checking the file
+    contents = dedent(
+        '''
+        branch_patterns:
+        - master
+        - "{name}-rb-.*"
+
+        unknown_option: true
+        '''
+    )
+    assert JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY) == []
+    assert matrix_spy.call_count == 0
+
+    feature_repository = Repository(url='https://space.git', branch='space-rb-1.0')
+    with pytest.raises(UnknownJobsDoneFileOption):
+        JobsDoneJob.CreateFromYAML(contents, repository=feature_repository)
+
+    # Patterns depending on the matrix or conditions are only checked for each matrix row
+    for patterns in [
+        '''
+        branch_patterns:
+        - "{planet}"
+        ''',
+        '''
+        branch_patterns:
+        - master
+
+        planet-earth:branch_patterns:
+        - milky_way
+        ''',
+    ]:
+        contents = dedent(patterns) + dedent(
+            '''
+            matrix:
+                planet:
+                - earth
+                - milky_way
+            '''
+        )
+        jobs = JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)
+        assert len(jobs) == 1
+
+
+def testLoadYAML():
+    import yaml
+
+    JobsDoneJob.ClearCache()
+    contents = dedent(
+        '''
+        timeout: 10
+        shallow: true
+        matrix:
+            planet:
+            - earth
+            - mars,ares
+        '''
+    )
+    data = LoadYAML(contents + '\t')
+    # All values are loaded as strings, with or without libyaml
+    assert data == {'timeout': '10', 'shallow': 'true', 'matrix': {'planet': ['earth', 'mars,ares']}}
+    assert data == yaml.load(contents, Loader=yaml.loader.BaseLoader)
+
+    # Parsed contents are cached
+    assert LoadYAML(contents) is data
+    JobsDoneJob.ClearCache()
+    assert LoadYAML(contents) is not data
+
+
+def testJobsDoneJobSlots():
+    job = JobsDoneJob()
+    assert job.junit_patterns is None
+    assert job.repository is None
+    assert job.matrix_row is None
+    assert not hasattr(job, '__dict__')
+
+    job.junit_patterns = ['*.xml']
+    assert job.junit_patterns == ['*.xml']
+    with pytest.raises(AttributeError):
+        job.unknown_option
+    with pytest.raises(AttributeError):
+        job.unknown_option = 'value'
+
+
+def testSharedOptionValues():
+    JobsDoneJob.ClearCache()
+    contents = dedent(
+        '''
+        junit_patterns:
+        - "{branch}.xml"
+
+        build_shell_commands:
+        - "make {planet}"
+
+        email_notification:
+            recipients: user@space.com
+
+        matrix:
+            planet:
+            - earth
+            - mars
+        '''
+    )
+
+    def CheckShared(first, second):
+        # Equal values (even if formatted for each row) are shared
+        assert first.junit_patterns == ['milky_way.xml']
+        assert first.junit_patterns is second.junit_patterns
+        assert first.email_notification == {'recipients': 'user@space.com'}
+        assert first.email_notification is second.email_notification
+        assert first.matrix is second.matrix
+        assert first.build_shell_commands == ['make earth']
+        assert second.build_shell_commands == ['make mars']
+
+    CheckShared(*JobsDoneJob.IterFromYAML(contents, repository=_REPOSITORY))
+
+    # Also when created (and cached) all at once, and when taken from the cache
+    CheckShared(*JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY))
+    CheckShared(*JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY))
+    CheckShared(*JobsDoneJob.IterFromYAML(contents, repository=_REPOSITORY))
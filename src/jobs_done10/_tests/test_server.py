@@ -3,6 +3,16 @@ from textwrap import dedent
 import pytest
 import requests_mock
 from jobs_done10.repository import Repository
+from jobs_done10.server import process_pending_deliveries
+
+
+@pytest.fixture(autouse=True)
+def clear_caches_():
+    from jobs_done10.server import clear_caches
+
+    clear_caches()
+    yield
+    clear_caches()
 
 
 @pytest.fixture(name='client')
@@ -12,6 +22,11 @@ def client_(monkeypatch, tmpdir):
     env_vars = tmpdir.join('env_vars')
     monkeypatch.setenv('JOBSDONE_DOTENV', str(env_vars))
 
+    # Use a fresh queue for each test, processing deliveries explicitly (no background workers)
+    monkeypatch.setenv('JD_QUEUE_FILE', str(tmpdir.join('queue.sqlite')))
+    monkeypatch.setenv('JD_WORKERS', '0')
+    monkeypatch.setenv('JD_DELIVERIES_TOKEN', 'deliveries_token')
+
     env_vars.write("""
         JD_JENKINS_URL=https://example.com/jenkins
         JD_JENKINS_USERNAME=jenkins_user
@@ -31,6 +46,15 @@ def client_(monkeypatch, tmpdir):
     return app.test_client()
 
 
+def get_delivery(client, delivery_id):
+    """
+    Returns the status of a delivery, including its result.
+    """
+    response = client.get(f'/deliveries/{delivery_id}', headers={'Authorization': 'Bearer deliveries_token'})
+    assert response.status_code == 200
+    return response.json
+
+
 @pytest.fixture(name='post_json_data')
 def post_json_data_():
     """
@@ -87,9 +111,10 @@ def test_post(client, post_json_data, mocker, repo_info_json_data):
     new_jobs = ['new1-eden-master', 'new2-eden-master']
     updated_jobs = ['upd1-eden-master', 'upd2-eden-master']
     deleted_jobs = ['del1-eden-master', 'del2-eden-master']
+    unchanged_jobs = ['unc1-eden-master']
 
     upload_mock = mocker.patch('jobs_done10.generators.jenkins.UploadJobsFromFile', autospec=True,
-                               return_value=(new_jobs, updated_jobs, deleted_jobs))
+                               return_value=(new_jobs, updated_jobs, deleted_jobs, unchanged_jobs))
 
     with requests_mock.Mocker() as m:
         stash_url = 'https://example.com/stash'
@@ -102,15 +127,29 @@ def test_post(client, post_json_data, mocker, repo_info_json_data):
         m.get(f'{stash_url}/rest/api/1.0/projects/{project_key}/repos/{slug}', json=repo_info_json_data)
 
         response = client.post(json=post_json_data)
-        assert response.status_code == 200
+        assert response.status_code == 202
         assert response.mimetype == 'text/plain'
-        assert response.data.decode('UTF-8') == dedent("""
+        assert response.data.decode('UTF-8') == 'Delivery 1 queued, status available at /deliveries/1'
+        assert response.headers['Location'].endswith('/deliveries/1')
+
+        # Nothing is done until the delivery is processed
+        assert upload_mock.call_count == 0
+        delivery = get_delivery(client, 1)
+        assert delivery['status'] == 'queued'
+        assert delivery['result'] is None
+
+        process_pending_deliveries()
+
+        delivery = get_delivery(client, 1)
+        assert delivery['status'] == 'done'
+        assert delivery['result'] == dedent("""
             NEW - new1-eden-master
             NEW - new2-eden-master
             UPD - upd1-eden-master
             UPD - upd2-eden-master
             DEL - del1-eden-master
             DEL - del2-eden-master
+            UNC - unc1-eden-master
         """).strip()
 
     assert upload_mock.call_count == 1
@@ -122,9 +161,233 @@ def test_post(client, post_json_data, mocker, repo_info_json_data):
         url='https://example.com/jenkins',
         username='jenkins_user',
         password='jenkins_password',
+        jobs_index=None,
     )
 
 
+def test_jobs_index(client, post_json_data, mocker, repo_info_json_data, monkeypatch, tmpdir):
+    from jobs_done10.generators.jenkins import JenkinsJobsIndex
+
+    monkeypatch.setenv('JD_JOBS_INDEX_FILE', str(tmpdir / 'index.sqlite'))
+    upload_mock = mocker.patch('jobs_done10.generators.jenkins.UploadJobsFromFile', autospec=True,
+                               return_value=([], [], [], []))
+
+    with requests_mock.Mocker() as m:
+        stash_url = 'https://example.com/stash'
+        m.get(f'{stash_url}/projects/ESSS/repos/eden/raw/.jobs_done.yaml', status_code=404)
+        m.get(f'{stash_url}/rest/api/1.0/projects/ESSS/repos/eden', json=repo_info_json_data)
+        response = client.post(json=post_json_data)
+        assert response.status_code == 202
+        process_pending_deliveries()
+
+    jobs_index = upload_mock.call_args[1]['jobs_index']
+    assert isinstance(jobs_index, JenkinsJobsIndex)
+    assert jobs_index.filename == str(tmpdir / 'index.sqlite')
+
+
+def test_coalesce_pushes(client, post_json_data, mocker, repo_info_json_data):
+    import copy
+
+    upload_mock = mocker.patch('jobs_done10.generators.jenkins.UploadJobsFromFile', autospec=True,
+                               return_value=([], ['eden-stable-pwda11-master'], [], []))
+
+    newer_post_json_data = copy.deepcopy(post_json_data)
+    newer_post_json_data['changes'][0]['fromHash'] = '8522b06a7c330008814a522d0342be9a997a1460'
+    newer_post_json_data['changes'][0]['toHash'] = 'f6a3a7d7ba5d5fd9b2ea4df0c5a8f3a4f1ed4b0c'
+
+    with requests_mock.Mocker() as m:
+        stash_url = 'https://example.com/stash'
+        m.get(f'{stash_url}/projects/ESSS/repos/eden/raw/.jobs_done.yaml', text='contents')
+        m.get(f'{stash_url}/rest/api/1.0/projects/ESSS/repos/eden', json=repo_info_json_data)
+        assert client.post(json=post_json_data).status_code == 202
+        assert client.post(json=newer_post_json_data).status_code == 202
+        process_pending_deliveries()
+
+        # Only the latest commit was fetched
+        assert [r.qs['at'] for r in m.request_history if 'raw' in r.path] == [
+            ['f6a3a7d7ba5d5fd9b2ea4df0c5a8f3a4f1ed4b0c']]
+
+    assert upload_mock.call_count == 1
+    assert get_delivery(client, 1) == dict(
+        get_delivery(client, 1),
+        status='done',
+        result='SKIPPED - stable-pwda11-master @ 8522b06: superseded by delivery 2',
+    )
+    assert get_delivery(client, 2)['result'] == 'UPD - eden-stable-pwda11-master'
+
+
+def test_delivery_error(client, post_json_data, mocker, repo_info_json_data):
+    mocker.patch('jobs_done10.generators.jenkins.UploadJobsFromFile', autospec=True,
+                 side_effect=RuntimeError('could not upload'))
+    email_mock = mocker.patch('jobs_done10.server.send_email_with_error', autospec=True,
+                              return_value='bugreport+jenkins@esss.co')
+
+    with requests_mock.Mocker() as m:
+        stash_url = 'https://example.com/stash'
+        m.get(f'{stash_url}/projects/ESSS/repos/eden/raw/.jobs_done.yaml', text='contents')
+        m.get(f'{stash_url}/rest/api/1.0/projects/ESSS/repos/eden', json=repo_info_json_data)
+        response = client.post(json=post_json_data)
+        assert response.status_code == 202
+        process_pending_deliveries()
+
+    delivery = get_delivery(client, 1)
+    assert delivery['status'] == 'failed'
+    result = delivery['result']
+    assert 'ERROR processing delivery 1' in result
+    assert 'RuntimeError: could not upload' in result
+    assert 'Email sent to bugreport+jenkins@esss.co' in result
+
+    assert email_mock.call_count == 1
+    args, kwargs = email_mock.call_args
+    assert args[0] == post_json_data
+    assert 'RuntimeError: could not upload' in args[1]
+
+
+def test_multiple_changes(client, post_json_data, mocker, repo_info_json_data):
+    import copy
+    import threading
+
+    branches = ['alpha', 'bravo', 'charlie', 'delta']
+    original_change = post_json_data['changes'][0]
+    post_json_data['changes'] = []
+    for branch in branches:
+        change = copy.deepcopy(original_change)
+        change['ref']['id'] = change['refId'] = f'refs/heads/{branch}'
+        post_json_data['changes'].append(change)
+
+    # All uploads wait for each other: this only finishes if changes are processed concurrently
+    barrier = threading.Barrier(len(branches) - 1, timeout=10)
+
+    def upload(repository, **kwargs):
+        if repository.branch == 'charlie':
+            raise RuntimeError('could not upload charlie')
+        barrier.wait()
+        return [f'eden-{repository.branch}'], [], [], []
+
+    mocker.patch('jobs_done10.generators.jenkins.UploadJobsFromFile', autospec=True, side_effect=upload)
+    email_mock = mocker.patch('jobs_done10.server.send_email_with_error', autospec=True,
+                              return_value='bugreport+jenkins@esss.co')
+
+    with requests_mock.Mocker() as m:
+        stash_url = 'https://example.com/stash'
+        m.get(f'{stash_url}/projects/ESSS/repos/eden/raw/.jobs_done.yaml', text='contents')
+        m.get(f'{stash_url}/rest/api/1.0/projects/ESSS/repos/eden', json=repo_info_json_data)
+        assert client.post(json=post_json_data).status_code == 202
+        process_pending_deliveries()
+
+    delivery = get_delivery(client, 1)
+    assert delivery['status'] == 'failed'
+    result = delivery['result']
+    # Results of the other changes are reported (in order) along with the error
+    assert 'NEW - eden-alpha\nNEW - eden-bravo\nNEW - eden-delta' in result
+    assert 'refs/heads/charlie @ 8522b06a7c330008814a522d0342be9a997a1460' in result
+    assert 'RuntimeError: could not upload charlie' in result
+
+    assert email_mock.call_count == 1
+    args, kwargs = email_mock.call_args
+    assert 'NEW - eden-alpha' in args[1]
+    assert 'RuntimeError: could not upload charlie' in args[1]
+
+
+def test_unknown_delivery(client):
+    response = client.get('/deliveries/42')
+    assert response.status_code == 404
+
+
+def test_delivery_result_authorization(client, post_json_data, monkeypatch):
+    assert client.post(json=post_json_data).status_code == 202
+    assert get_delivery(client, 1)['result'] is None
+
+    # Only the status is reported to requests without the token (or when there is none)
+    for headers in ({}, {'Authorization': 'Bearer wrong_token'}, {'Authorization': 'deliveries_token'}):
+        response = client.get('/deliveries/1', headers=headers)
+        assert response.status_code == 200
+        assert sorted(response.json) == ['created', 'id', 'status', 'updated']
+        assert response.json['status'] == 'queued'
+
+    monkeypatch.delenv('JD_DELIVERIES_TOKEN')
+    response = client.get('/deliveries/1', headers={'Authorization': 'Bearer '})
+    assert sorted(response.json) == ['created', 'id', 'status', 'updated']
+
+
+def test_stash_session(monkeypatch):
+    from jobs_done10.server import get_clone_url, get_stash_session
+
+    session = get_stash_session('https://example.com/stash', 'stash_user', 'stash_password')
+    assert session.auth == ('stash_user', 'stash_password')
+    assert get_stash_session('https://example.com/stash', 'stash_user', 'stash_password') is session
+    assert get_stash_session('https://example.com/stash', 'other_user', 'stash_password') is not session
+
+    monkeypatch.setenv('JD_STASH_TIMEOUT', '12.5')
+    with requests_mock.Mocker() as m:
+        m.get('https://example.com/stash/rest/api/1.0/projects/ESSS/repos/eden',
+              json={'links': {'clone': [{'name': 'ssh', 'href': 'ssh://eden.git'}]}})
+        clone_url = get_clone_url(stash_url='https://example.com/stash', username='stash_user',
+                                  password='stash_password', project_key='ESSS', slug='eden')
+        assert clone_url == 'ssh://eden.git'
+        assert m.request_history[0].timeout == 12.5
+
+
+def test_clone_url_cache(client, repo_info_json_data, monkeypatch, tmpdir):
+    from jobs_done10.server import get_clone_url
+
+    kwargs = dict(stash_url='https://example.com/stash', username='stash_user', password='stash_password',
+                  project_key='ESSS', slug='eden')
+    url = 'https://example.com/stash/rest/api/1.0/projects/ESSS/repos/eden'
+    expected = 'ssh://git@eden.fln.esss.com.br:7999/esss/eden.git'
+    with requests_mock.Mocker() as m:
+        m.get(url, json=repo_info_json_data)
+        assert get_clone_url(**kwargs) == expected
+        assert get_clone_url(**kwargs) == expected
+        assert m.call_count == 1
+
+        # Expired entries are fetched again
+        monkeypatch.setenv('JD_CLONE_URL_CACHE_TTL', '-1')
+        assert get_clone_url(**kwargs) == expected
+        assert m.call_count == 2
+
+    assert client.get('/metrics').json == {'clone_url_cache_hits': 1, 'clone_url_cache_misses': 2}
+
+    # The disk cache is shared by all processes (simulated by clearing the in-memory caches)
+    from jobs_done10.server import clear_caches
+    clear_caches()
+    monkeypatch.setenv('JD_CLONE_URL_CACHE_TTL', '3600')
+    monkeypatch.setenv('JD_CACHE_FILE', str(tmpdir / 'cache.sqlite'))
+    with requests_mock.Mocker() as m:
+        m.get(url, json=repo_info_json_data)
+        assert get_clone_url(**kwargs) == expected
+        assert m.call_count == 1
+        clear_caches()
+        assert get_clone_url(**kwargs) == expected
+        assert m.call_count == 1
+
+    assert client.get('/metrics').json == {'clone_url_disk_cache_hits': 1}
+
+
+def test_file_contents_cache(client):
+    from jobs_done10.server import get_file_contents
+
+    kwargs = dict(stash_url='https://example.com/stash', username='stash_user', password='stash_password',
+                  project_key='ESSS', slug='eden', path='.jobs_done.yaml')
+    url = 'https://example.com/stash/projects/ESSS/repos/eden/raw/.jobs_done.yaml'
+    with requests_mock.Mocker() as m:
+        m.get(f'{url}?at=first', text='first contents')
+        m.get(f'{url}?at=second', text='second contents')
+        assert get_file_contents(ref='first', **kwargs) == 'first contents'
+        assert get_file_contents(ref='first', **kwargs) == 'first contents'
+        assert get_file_contents(ref='second', **kwargs) == 'second contents'
+        assert m.call_count == 2
+
+        # Missing files are not cached
+        m.get(f'{url}?at=missing', status_code=404)
+        for _ in range(2):
+            with pytest.raises(IOError):
+                get_file_contents(ref='missing', **kwargs)
+        assert m.call_count == 4
+
+    assert client.get('/metrics').json == {'file_contents_cache_hits': 1, 'file_contents_cache_misses': 4}
+
+
 def test_version(client):
     import pkg_resources
 
@@ -167,3 +430,22 @@ def test_error_handling(client, post_json_data, mocker):
     assert message.Subject == 'JobsDone failure during push to ESSS/eden (stable-pwda11-master @ 8522b06)'
     assert message.charset == 'UTF-8'
     assert 'An error happened when processing your push' in message.Body
+
+
+def test_gunicorn_post_fork(monkeypatch, mocker, tmpdir):
+    import os
+
+    from jobs_done10.server_gunicorn_config import post_fork
+
+    env_vars = tmpdir.join('env_vars')
+    env_vars.write('JD_WORKERS=3\n')
+    monkeypatch.setenv('JOBSDONE_DOTENV', str(env_vars))
+    # Make sure the variable set by the .env file is removed afterwards
+    monkeypatch.setenv('JD_WORKERS', '0')
+    monkeypatch.delenv('JD_WORKERS')
+    start_workers_mock = mocker.patch('jobs_done10.server.start_workers', autospec=True)
+
+    # Workers start along with each gunicorn worker process, configured by the .env file
+    post_fork(server=None, worker=None)
+    start_workers_mock.assert_called_once_with()
+    assert os.environ['JD_WORKERS'] == '3'
@@ -0,0 +1,42 @@
+from jobs_done10.server_cache import DiskCache
+
+
+def test_disk_cache(tmpdir):
+    cache = DiskCache(str(tmpdir / 'cache.sqlite'))
+    assert cache.get('key') is None
+
+    cache.set('key', 'value')
+    assert cache.get('key') == 'value'
+    assert cache.get('key', ttl=3600) == 'value'
+    assert cache.get('key', ttl=-1) is None
+
+    # The same database can be shared by many caches (processes)
+    cache.set('key', 'new value')
+    assert DiskCache(cache.filename).get('key') == 'new value'
+
+    cache.delete('key')
+    assert cache.get('key') is None
+
+
+def test_disk_cache_eviction(tmpdir, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('time.time', lambda: now[0])
+
+    cache = DiskCache(str(tmpdir / 'cache.sqlite'), max_entries=3, max_age=60)
+    for i in range(5):
+        now[0] += 1
+        cache.set(f'key{i}', f'value{i}')
+    # Only the newest entries are kept
+    assert [cache.get(f'key{i}') for i in range(5)] == [None, None, 'value2', 'value3', 'value4']
+
+    # Setting a key again makes it the newest
+    now[0] += 1
+    cache.set('key2', 'new value2')
+    now[0] += 1
+    cache.set('key5', 'value5')
+    assert [cache.get(f'key{i}') for i in range(6)] == [None, None, 'new value2', None, 'value4', 'value5']
+
+    # Old entries are deleted when any entry is set
+    now[0] += 60
+    cache.set('key6', 'value6')
+    assert [cache.get(f'key{i}') for i in range(7)] == [None, None, None, None, None, 'value5', 'value6']
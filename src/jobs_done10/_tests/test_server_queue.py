@@ -0,0 +1,78 @@
+from jobs_done10.server_queue import DeliveryQueue
+
+
+def test_queue(tmpdir):
+    queue = DeliveryQueue(str(tmpdir / 'queue.sqlite'))
+    assert queue.take() is None
+
+    first = queue.put({'eventKey': 'first'})
+    second = queue.put({'eventKey': 'second'})
+    assert queue.get(first)['status'] == DeliveryQueue.QUEUED
+
+    # Deliveries are taken in order, only once
+    assert queue.take() == (first, {'eventKey': 'first'})
+    assert queue.get(first)['status'] == DeliveryQueue.RUNNING
+    assert queue.take() == (second, {'eventKey': 'second'})
+    assert queue.take() is None
+
+    queue.finish(first, DeliveryQueue.DONE, 'NEW - job')
+    queue.finish(second, DeliveryQueue.FAILED, 'ERROR')
+    assert queue.get(first)['status'] == DeliveryQueue.DONE
+    assert queue.get(first)['result'] == 'NEW - job'
+    assert queue.get(second)['status'] == DeliveryQueue.FAILED
+
+    # The same database can be shared by many queues (processes)
+    assert DeliveryQueue(queue.filename).get(second)['result'] == 'ERROR'
+    assert queue.get(1000) is None
+
+
+def test_stale_deliveries(tmpdir):
+    queue = DeliveryQueue(str(tmpdir / 'queue.sqlite'), stale_timeout=-1)
+    delivery_id = queue.put({})
+    assert queue.take() == (delivery_id, {})
+
+    # The worker which took the delivery never finished it, so it is taken again
+    assert queue.take() == (delivery_id, {})
+
+
+def test_retention(tmpdir):
+    queue = DeliveryQueue(str(tmpdir / 'queue.sqlite'), retention=-1)
+    delivery_id = queue.put({})
+    queue.take()
+    queue.finish(delivery_id, DeliveryQueue.DONE, '')
+
+    # Old processed deliveries are removed when new ones arrive
+    queue.put({})
+    assert queue.get(delivery_id) is None
+
+
+def test_latest_delivery(tmpdir):
+    queue = DeliveryQueue(str(tmpdir / 'queue.sqlite'))
+    assert queue.get_latest_delivery('master') is None
+
+    first = queue.put({}, keys=['master', 'feature'])
+    second = queue.put({}, keys=['master'])
+    queue.put({})
+    assert queue.get_latest_delivery('master') == second
+    assert queue.get_latest_delivery('feature') == first
+
+
+def test_deliveries_with_same_keys(tmpdir):
+    queue = DeliveryQueue(str(tmpdir / 'queue.sqlite'))
+    first = queue.put({}, keys=['master'])
+    second = queue.put({}, keys=['master', 'feature'])
+    third = queue.put({}, keys=['feature'])
+    fourth = queue.put({}, keys=['other'])
+
+    # Deliveries are not taken while others with the same keys are running or queued before them
+    assert queue.take() == (first, {})
+    assert queue.take() == (fourth, {})
+    assert queue.take() is None
+
+    queue.finish(first, DeliveryQueue.DONE, '')
+    assert queue.take() == (second, {})
+    assert queue.take() is None
+
+    queue.finish(second, DeliveryQueue.FAILED, '')
+    assert queue.take() == (third, {})
+    assert queue.take() is None
@@ -19,7 +19,7 @@ def jenkins(url, username=None, password=None):
 
     repository, jobs = GetJobsFromDirectory()
     publisher = JenkinsJobPublisher(repository, jobs)
-    new_jobs, updated_jobs, deleted_jobs = publisher.PublishToUrl(url, username, password)
+    new_jobs, updated_jobs, deleted_jobs, unchanged_jobs = publisher.PublishToUrl(url, username, password)
 
     for job in new_jobs:
         click.secho('NEW', fg='green', nl=False)
@@ -33,6 +33,10 @@ def jenkins(url, username=None, password=None):
         click.secho('DEL', fg='red', nl=False)
         click.secho(' - ', nl=False)
         click.secho(job)
+    for job in unchanged_jobs:
+        click.secho('UNC', fg='white', nl=False)
+        click.secho(' - ', nl=False)
+        click.secho(job)
 
 
 @click.command()
@@ -41,13 +45,12 @@ def jenkins_test(output_directory):
     """
     Save the resulting '.xml's in a directory.
     """
-    from jobs_done10.generators.jenkins import GetJobsFromDirectory, JenkinsJobPublisher
+    from jobs_done10.generators.jenkins import IterJobsFromDirectory, PublishJobsToDirectory
 
     click.secho('Saving jobs in "%s"' % output_directory)
 
-    repository, jobs = GetJobsFromDirectory()
-    publisher = JenkinsJobPublisher(repository, jobs)
-    publisher.PublishToDirectory(output_directory)
+    repository, jobs = IterJobsFromDirectory()
+    PublishJobsToDirectory(repository, jobs, output_directory)
 
     click.secho('OK', fg='green')
 
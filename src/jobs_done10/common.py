@@ -4,4 +4,133 @@
 def AsList(arg):
     """return the given argument unchanged if already a list or tuple, otherwise return a single
     element list"""
-    return arg if isinstance(arg, (tuple, list)) else [arg]
\ No newline at end of file
+    return arg if isinstance(arg, (tuple, list)) else [arg]
+
+
+#===================================================================================================
+# LruCache
+#===================================================================================================
+class LruCache(object):
+    '''
+    A thread-safe cache with a maximum number of entries and an optional time-to-live.
+
+    When full, the least recently used entry is evicted to make room for new ones. Entries older
+    than `ttl` seconds are treated as missing.
+    '''
+
+    def __init__(self, max_size=128, ttl=None, timer=None):
+        '''
+        :param int max_size:
+            Maximum number of entries kept in the cache.
+
+        :param float|None ttl:
+            Time (in seconds) an entry is kept in the cache. If None, entries never expire.
+
+        :param callable|None timer:
+            Function returning the current time in seconds. Defaults to `time.monotonic`.
+        '''
+        import collections
+        import threading
+        import time
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self._timer = timer or time.monotonic
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+
+    def Get(self, key, default=None):
+        '''
+        :return object:
+            The value cached for `key`, or `default` if it is not cached (or expired).
+        '''
+        with self._lock:
+            try:
+                value, timestamp = self._entries[key]
+            except KeyError:
+                return default
+
+            if self.ttl is not None and self._timer() - timestamp > self.ttl:
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+
+    def Set(self, key, value):
+        '''
+        Caches `value` for `key`, evicting the least recently used entry if the cache is full.
+        '''
+        with self._lock:
+            self._entries[key] = (value, self._timer())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+    def Invalidate(self, key):
+        '''
+        Removes `key` from the cache, if present.
+        '''
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+    def Clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+
+#===================================================================================================
+# SQLiteConnection
+#===================================================================================================
+class SQLiteConnection(object):
+    '''
+    Context manager for a connection to a SQLite database, which may be shared by many processes.
+
+    Transactions are managed explicitly (for instance, starting them with `BEGIN IMMEDIATE`): on
+    exit, a pending transaction is committed (or rolled back, on errors) and the connection is
+    closed, unlike sqlite3.Connection which only ends the transaction.
+    '''
+
+    def __init__(self, filename, timeout=30):
+        '''
+        :param unicode filename:
+            Path to the SQLite database, created if it does not exist.
+
+        :param float timeout:
+            Time (in seconds) to wait for locks held by other connections.
+        '''
+        self.filename = filename
+        self.timeout = timeout
+        self._connection = None
+
+
+    def __enter__(self):
+        '''
+        :rtype: sqlite3.Connection
+        '''
+        import sqlite3
+
+        # isolation_level=None: transactions are managed explicitly
+        self._connection = sqlite3.connect(self.filename, timeout=self.timeout, isolation_level=None)
+        return self._connection
+
+
+    def __exit__(self, exc_type, exc_value, tb):
+        connection, self._connection = self._connection, None
+        try:
+            if connection.in_transaction:
+                if exc_type is None:
+                    connection.commit()
+                else:
+                    connection.rollback()
+        finally:
+            connection.close()
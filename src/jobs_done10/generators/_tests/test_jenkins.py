@@ -9,7 +9,8 @@ from textwrap import dedent
 import jenkins
 import pytest
 from jobs_done10.generators.jenkins import (
-    GetJobsFromDirectory, GetJobsFromFile, JenkinsJob, JenkinsJobPublisher, JenkinsXmlJobGenerator,
+    GetJobsFromDirectory, GetJobsFromFile, IterJobsFromFile, JenkinsJob, JenkinsJobPublisher,
+    JenkinsJobsIndex, JenkinsPublishError, JenkinsXmlJobGenerator, PublishJobsToDirectory,
     UploadJobsFromFile)
 from jobs_done10.job_generator import JobGeneratorConfigurator
 from jobs_done10.jobs_done_job import JOBS_DONE_FILENAME, JobsDoneFileTypeError, JobsDoneJob
@@ -1818,6 +1819,39 @@ class TestJenkinsXmlJobGenerator(object):
             )
 
 
+    def testResetReusesBaseXml(self):
+        repository = Repository(url='http://fake.git', branch='not_master')
+        jobs_done_jobs = JobsDoneJob.CreateFromYAML(
+            dedent(
+                '''
+                matrix:
+                  planet:
+                  - mars
+                  - earth
+
+                planet-mars:additional_repositories:
+                - git:
+                    url: http://some_url.git
+                '''
+            ),
+            repository,
+        )
+
+        # Jobs configured after one which changed the scm element must not be affected by it
+        job_generator = JenkinsXmlJobGenerator()
+        xmls = []
+        for jobs_done_job in jobs_done_jobs + jobs_done_jobs:
+            JobGeneratorConfigurator.Configure(job_generator, jobs_done_job)
+            xmls.append(job_generator.GetJob().xml)
+
+        assert xmls[0] != xmls[1]
+        assert xmls[:2] == xmls[2:]
+
+        fresh_generator = JenkinsXmlJobGenerator()
+        JobGeneratorConfigurator.Configure(fresh_generator, jobs_done_jobs[1])
+        assert xmls[1] == fresh_generator.GetJob().xml
+
+
     def _GenerateJob(self, yaml_contents):
         repository = Repository(url='http://fake.git', branch='not_master')
         jobs_done_jobs = JobsDoneJob.CreateFromYAML(yaml_contents, repository)
@@ -1897,6 +1931,97 @@ class TestJenkinsActions(object):
         assert len(jobs) == 3
 
 
+    def testIterJobsFromFile(self, tmpdir):
+        jobs = IterJobsFromFile(self._REPOSITORY, self._JOBS_DONE_FILE_CONTENTS)
+        assert next(jobs).name == 'space-branch-mercury'
+
+        PublishJobsToDirectory(self._REPOSITORY, jobs, str(tmpdir))
+        assert set(os.path.basename(str(x)) for x in tmpdir.listdir()) == {
+            'space-branch-venus', 'space-branch-jupiter'}
+
+        expected_jobs = GetJobsFromFile(self._REPOSITORY, self._JOBS_DONE_FILE_CONTENTS)
+        lazy_jobs = IterJobsFromFile(self._REPOSITORY, self._JOBS_DONE_FILE_CONTENTS)
+        assert [job._replace(xml=job.xml) for job in lazy_jobs] == expected_jobs
+        assert list(IterJobsFromFile(self._REPOSITORY, None)) == []
+
+
+    def testLazyJobXml(self, tmpdir):
+        calls = []
+
+        def Produce(on_fingerprint):
+            calls.append(None)
+            yield '<project>'
+            yield 'Ação'
+            yield '</project>'
+            on_fingerprint('fingerprint')
+
+        job = JenkinsJob(name='space-branch-mercury', repository=self._REPOSITORY, xml_producer=Produce)
+        assert calls == []
+
+        PublishJobsToDirectory(self._REPOSITORY, [job], str(tmpdir))
+        assert tmpdir.join('space-branch-mercury').read_binary() == '<project>Ação</project>'.encode('utf-8')
+        assert len(calls) == 1
+        assert job.fingerprint == 'fingerprint'
+
+        assert job.xml == '<project>Ação</project>'
+        assert job.xml == '<project>Ação</project>'
+        assert len(calls) == 2
+        assert job._replace(xml=job.xml) == JenkinsJob(
+            name='space-branch-mercury', repository=self._REPOSITORY, xml='<project>Ação</project>')
+
+
+    def testJenkinsJobTuple(self):
+        jobs = GetJobsFromFile(self._REPOSITORY, self._JOBS_DONE_FILE_CONTENTS)
+        lazy_jobs = list(IterJobsFromFile(self._REPOSITORY, self._JOBS_DONE_FILE_CONTENTS))
+
+        # Only jobs meant to be written right away keep their xml tree until it is serialized
+        assert all(job._xml_producer is None for job in jobs)
+        assert all(job._xml_producer is not None for job in lazy_jobs)
+
+        job = jobs[0]
+        assert isinstance(job, tuple)
+        name, repository, xml = job
+        assert (name, repository, xml) == (job.name, job.repository, job.xml) == tuple(job)
+        assert job == (name, repository, xml)
+        assert job[0] == name
+        assert len(job) == 3
+        assert job._asdict() == {'name': name, 'repository': repository, 'xml': xml}
+
+        # Lazy jobs only have their xml as an attribute
+        lazy_job = lazy_jobs[0]
+        assert lazy_job == (name, repository, None)
+        assert lazy_job != job
+        assert lazy_job.xml == xml
+        assert lazy_job._replace(xml=lazy_job.xml) == job
+
+        renamed = lazy_jobs[1]._replace(name='renamed')
+        assert renamed.name == 'renamed'
+        assert renamed.xml == jobs[1].xml
+        assert renamed.fingerprint == jobs[1].fingerprint
+        assert job._replace(xml='<project/>').xml == '<project/>'
+        with pytest.raises(ValueError):
+            job._replace(url='http://some_url.git')
+
+        import copy
+        assert copy.deepcopy(lazy_jobs[2]) == jobs[2]
+
+
+    def testJobFingerprint(self):
+        from jobs_done10.xml_factory import GetXmlFingerprint
+
+        jobs = GetJobsFromFile(self._REPOSITORY, self._JOBS_DONE_FILE_CONTENTS)
+        fingerprints = [job.fingerprint for job in jobs]
+        assert len(set(fingerprints)) == len(jobs)
+
+        # The same as obtained from the xml, and not changed by reformatting it
+        for job, fingerprint in zip(jobs, fingerprints):
+            assert GetXmlFingerprint(job.xml) == fingerprint
+            xml = re.sub(r'>\s+<', '><', job.xml)
+            assert JenkinsJob(name=job.name, repository=self._REPOSITORY, xml=xml).fingerprint == fingerprint
+
+        assert JenkinsJob(name='invalid', repository=self._REPOSITORY, xml='<project>').fingerprint is None
+
+
     def testGetJobsFromDirectory(self, tmpdir):
         repo_path = tmpdir / 'git_repository'
         repo_path.mkdir()
@@ -1929,7 +2054,7 @@ class TestJenkinsActions(object):
         '''
         Tests that UploadJobsFromFile correctly calls JenkinsJobPublisher (already tested elsewhere)
         '''
-        def MockPublishToUrl(self, url, username, password):
+        def MockPublishToUrl(self, url, username, password, jobs_index=None):
             assert url == 'jenkins_url'
             assert username == 'jenkins_user'
             assert password == 'jenkins_pass'
@@ -1956,6 +2081,13 @@ class TestJenkinsActions(object):
 #===================================================================================================
 class TestJenkinsPublisher(object):
 
+    @pytest.fixture(autouse=True)
+    def _ClearBranchCache(self):
+        JenkinsJobPublisher.ClearBranchCache()
+        yield
+        JenkinsJobPublisher.ClearBranchCache()
+
+
     def testPublishToDirectory(self, tmpdir):
         self._GetPublisher().PublishToDirectory(str(tmpdir))
 
@@ -1970,7 +2102,7 @@ class TestJenkinsPublisher(object):
     def testPublishToUrl(self, monkeypatch):
         mock_jenkins = self._MockJenkinsAPI(monkeypatch)
 
-        new_jobs, updated_jobs, deleted_jobs = self._GetPublisher().PublishToUrl(
+        new_jobs, updated_jobs, deleted_jobs, unchanged_jobs = self._GetPublisher().PublishToUrl(
             url='jenkins_url',
             username='jenkins_user',
             password='jenkins_pass',
@@ -1978,6 +2110,7 @@ class TestJenkinsPublisher(object):
         assert set(new_jobs) == mock_jenkins.NEW_JOBS == {'space-milky_way-venus', 'space-milky_way-jupiter'}
         assert set(updated_jobs) == mock_jenkins.UPDATED_JOBS == {'space-milky_way-mercury'}
         assert set(deleted_jobs) == mock_jenkins.DELETED_JOBS == {'space-milky_way-saturn'}
+        assert unchanged_jobs == []
 
 
     def testPublishToUrlProxyErrorOnce(self, monkeypatch):
@@ -1986,7 +2119,7 @@ class TestJenkinsPublisher(object):
 
         # Tell mock jenkins to raise a proxy error, our retry should catch it and continue
         mock_jenkins = self._MockJenkinsAPI(monkeypatch, proxy_errors=1)
-        new_jobs, updated_jobs, deleted_jobs = self._GetPublisher().PublishToUrl(
+        new_jobs, updated_jobs, deleted_jobs, unchanged_jobs = self._GetPublisher().PublishToUrl(
             url='jenkins_url',
             username='jenkins_user',
             password='jenkins_pass',
@@ -1994,6 +2127,7 @@ class TestJenkinsPublisher(object):
         assert set(new_jobs) == mock_jenkins.NEW_JOBS == {'space-milky_way-venus', 'space-milky_way-jupiter'}
         assert set(updated_jobs) == mock_jenkins.UPDATED_JOBS == {'space-milky_way-mercury'}
         assert set(deleted_jobs) == mock_jenkins.DELETED_JOBS == {'space-milky_way-saturn'}
+        assert unchanged_jobs == []
 
 
     def testPublishToUrlProxyErrorTooManyTimes(self, monkeypatch):
@@ -2005,13 +2139,46 @@ class TestJenkinsPublisher(object):
         self._MockJenkinsAPI(monkeypatch, proxy_errors=5)
 
         from requests.exceptions import HTTPError
-        with pytest.raises(HTTPError):
+        with pytest.raises(JenkinsPublishError) as e:
+            self._GetPublisher().PublishToUrl(
+                url='jenkins_url',
+                username='jenkins_user',
+                password='jenkins_pass',
+            )
+
+        # Only the failed job is reported, all others were published normally
+        assert list(e.value.errors.keys()) == ['space-milky_way-saturn']
+        assert isinstance(e.value.errors['space-milky_way-saturn'], HTTPError)
+        assert e.value.new_jobs == ['space-milky_way-jupiter', 'space-milky_way-venus']
+        assert e.value.updated_jobs == ['space-milky_way-mercury']
+        assert e.value.deleted_jobs == []
+        assert '- space-milky_way-saturn:' in str(e.value)
+
+
+    def testPublishToUrlAggregatesErrors(self, monkeypatch):
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        def FailingCreateJob(self, name, xml):
+            raise RuntimeError('cannot create %s' % name)
+
+        monkeypatch.setattr(mock_jenkins, 'create_job', FailingCreateJob)
+
+        with pytest.raises(JenkinsPublishError) as e:
             self._GetPublisher().PublishToUrl(
                 url='jenkins_url',
                 username='jenkins_user',
                 password='jenkins_pass',
+                max_workers=1,
             )
 
+        # Every failure is reported, and did not prevent other jobs from being published
+        assert sorted(e.value.errors) == ['space-milky_way-jupiter', 'space-milky_way-venus']
+        assert e.value.new_jobs == []
+        assert e.value.updated_jobs == ['space-milky_way-mercury']
+        assert e.value.deleted_jobs == ['space-milky_way-saturn']
+        assert mock_jenkins.UPDATED_JOBS == {'space-milky_way-mercury'}
+        assert mock_jenkins.DELETED_JOBS == {'space-milky_way-saturn'}
+
 
     def testPublishToUrl2(self, monkeypatch):
         mock_jenkins = self._MockJenkinsAPI(monkeypatch)
@@ -2019,7 +2186,7 @@ class TestJenkinsPublisher(object):
         publisher = self._GetPublisher()
         publisher.jobs = {}
 
-        new_jobs, updated_jobs, deleted_jobs = publisher.PublishToUrl(
+        new_jobs, updated_jobs, deleted_jobs, unchanged_jobs = publisher.PublishToUrl(
             url='jenkins_url',
             username='jenkins_user',
             password='jenkins_pass',
@@ -2029,6 +2196,186 @@ class TestJenkinsPublisher(object):
         assert set(deleted_jobs) == mock_jenkins.DELETED_JOBS == {'space-milky_way-mercury', 'space-milky_way-saturn'}
 
 
+    def testPublishToUrlSkipsUnchangedJobs(self, monkeypatch):
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        # Same contents as the mocked config, but with different formatting
+        repository = Repository(url='http://server/space.git', branch='milky_way')
+        mercury_config = mock_jenkins('jenkins_url', 'jenkins_user', 'jenkins_pass').get_job_config(
+            'space-milky_way-mercury')
+        mercury_xml = '<?xml version="1.0" ?>\n' + re.sub(r'>\s+<', '><', mercury_config.strip())
+        assert mercury_xml != mercury_config
+
+        publisher = JenkinsJobPublisher(repository, [
+            JenkinsJob(name='space-milky_way-mercury', xml=mercury_xml, repository=repository),
+        ])
+
+        new_jobs, updated_jobs, deleted_jobs, unchanged_jobs = publisher.PublishToUrl(
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        )
+        assert new_jobs == []
+        assert updated_jobs == []
+        assert deleted_jobs == ['space-milky_way-saturn']
+        assert unchanged_jobs == ['space-milky_way-mercury']
+        assert mock_jenkins.UPDATED_JOBS == set()
+
+
+    def testPublishToUrlCachesBranches(self, monkeypatch):
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+        api = mock_jenkins('jenkins_url', 'jenkins_user', 'jenkins_pass')
+        repository = Repository(url='http://server/space.git', branch='milky_way')
+
+        mercury_config = api.get_job_config('space-milky_way-mercury')
+        configs = {
+            # A job from another branch, whose name starts like ours
+            'space-milky_way_2-pluto': mercury_config.replace('>milky_way<', '>milky_way_2<'),
+        }
+
+        get_jobs = mock_jenkins.get_jobs
+        get_job_config = mock_jenkins.get_job_config
+
+        def GetJobs(self):
+            return get_jobs(self) + [{'name': 'space-milky_way_2-pluto'}]
+
+        def GetJobConfig(self, job_name):
+            if job_name in configs:
+                self.CONFIG_REQUESTS.append(job_name)
+                return configs[job_name]
+            return get_job_config(self, job_name)
+
+        monkeypatch.setattr(mock_jenkins, 'get_jobs', GetJobs)
+        monkeypatch.setattr(mock_jenkins, 'get_job_config', GetJobConfig)
+
+        def Publish():
+            del mock_jenkins.CONFIG_REQUESTS[:]
+            job = JenkinsJob(name='space-milky_way-mercury', xml=mercury_config, repository=repository)
+            return JenkinsJobPublisher(repository, [job]).PublishToUrl(
+                url='jenkins_url',
+                username='jenkins_user',
+                password='jenkins_pass',
+            )
+
+        result = Publish()
+        assert result == [[], [], ['space-milky_way-saturn'], ['space-milky_way-mercury']]
+        assert sorted(mock_jenkins.CONFIG_REQUESTS) == [
+            'space-milky_way-mercury', 'space-milky_way-saturn', 'space-milky_way_2-pluto']
+
+        # Jobs known to belong to other branches are not obtained again...
+        result = Publish()
+        assert result == [[], [], ['space-milky_way-saturn'], ['space-milky_way-mercury']]
+        assert sorted(mock_jenkins.CONFIG_REQUESTS) == ['space-milky_way-mercury', 'space-milky_way-saturn']
+
+        # ... but configs of our jobs always are, since they might have been changed by others
+        configs['space-milky_way-mercury'] = mercury_config.replace(
+            '</project>', '<disabled>true</disabled></project>')
+        result = Publish()
+        assert result == [[], ['space-milky_way-mercury'], ['space-milky_way-saturn'], []]
+
+
+    def testPublishToUrlWithIndex(self, monkeypatch, tmpdir):
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+        jobs_index = JenkinsJobsIndex(str(tmpdir / 'index.sqlite'))
+        repository = Repository(url='http://server/space.git', branch='milky_way')
+
+        def Publish(publisher):
+            del mock_jenkins.CONFIG_REQUESTS[:]
+            JenkinsJobPublisher.ClearBranchCache()
+            return publisher.PublishToUrl(
+                url='jenkins_url',
+                username='jenkins_user',
+                password='jenkins_pass',
+                jobs_index=jobs_index,
+            )
+
+        def GetJobs():
+            # Read from a new index to make sure it is persistent
+            return JenkinsJobsIndex(jobs_index.filename).GetJobs('jenkins_url', repository)
+
+        # Nothing indexed yet, so all jobs are scanned
+        assert GetJobs() is None
+        get_jobs = mock_jenkins.get_jobs
+        mock_jenkins.get_jobs = lambda self: 1 / 0
+        with pytest.raises(ZeroDivisionError):
+            Publish(self._GetPublisher())
+        mock_jenkins.get_jobs = get_jobs
+
+        result = Publish(self._GetPublisher())
+        assert result == [
+            ['space-milky_way-jupiter', 'space-milky_way-venus'],
+            ['space-milky_way-mercury'],
+            ['space-milky_way-saturn'],
+            [],
+        ]
+        assert GetJobs() == {'space-milky_way-jupiter', 'space-milky_way-mercury', 'space-milky_way-venus'}
+
+        # Once indexed, only the jobs known by the index (or being published) are queried
+        mock_jenkins.get_jobs = lambda self: 1 / 0
+        publisher = self._GetPublisher()
+        del publisher.jobs['space-milky_way-venus']
+        result = Publish(publisher)
+        assert result == [
+            ['space-milky_way-jupiter'],
+            ['space-milky_way-mercury'],
+            [],
+            [],
+        ]
+        assert sorted(mock_jenkins.CONFIG_REQUESTS) == [
+            'space-milky_way-jupiter', 'space-milky_way-mercury', 'space-milky_way-venus']
+        assert GetJobs() == {'space-milky_way-jupiter', 'space-milky_way-mercury'}
+
+        # Jobs outside the index are not considered, even if they match our repository/branch
+        # (mock jenkins never really creates jobs, so jupiter is not found)
+        publisher.jobs = {}
+        result = Publish(publisher)
+        assert result == [[], [], ['space-milky_way-mercury'], []]
+        assert GetJobs() == set()
+
+        # Until the last scan of Jenkins is too old: then jobs missing from the index are found
+        import time
+
+        mock_jenkins.get_jobs = get_jobs
+        now = time.time() + JenkinsJobsIndex.FULL_SCAN_INTERVAL + 1
+        monkeypatch.setattr(time, 'time', lambda: now)
+        assert GetJobs() is None
+        result = Publish(publisher)
+        assert result == [[], [], ['space-milky_way-mercury', 'space-milky_way-saturn'], []]
+        assert GetJobs() == set()
+
+        # Without jobs indexed or to publish, Jenkins is not even contacted
+        monkeypatch.setattr(jenkins, 'Jenkins', lambda *args: 1 / 0)
+        result = Publish(publisher)
+        assert result == [[], [], [], []]
+
+
+    def testJenkinsJobsIndex(self, tmpdir):
+        filename = str(tmpdir / 'index.sqlite')
+        milky_way = Repository(url='http://server/space.git', branch='milky_way')
+        andromeda = Repository(url='http://server/space.git', branch='andromeda')
+
+        # Many processes can update the same index without losing each other's updates
+        first_index = JenkinsJobsIndex(filename)
+        second_index = JenkinsJobsIndex(filename)
+        assert first_index.GetJobs('jenkins_url', milky_way) is None
+        first_index.SetJobs('jenkins_url', milky_way, ['space-milky_way-mercury'], scanned=True)
+        second_index.SetJobs('jenkins_url', andromeda, ['space-andromeda-mercury'], scanned=True)
+        for jobs_index in (first_index, second_index):
+            assert jobs_index.GetJobs('jenkins_url', milky_way) == {'space-milky_way-mercury'}
+            assert jobs_index.GetJobs('jenkins_url', andromeda) == {'space-andromeda-mercury'}
+            assert jobs_index.GetJobs('other_url', andromeda) is None
+
+        second_index.SetJobs('jenkins_url', milky_way, [])
+        assert first_index.GetJobs('jenkins_url', milky_way) == set()
+
+        # Branches never scanned (or scanned too long ago) are not in the index
+        jobs_index = JenkinsJobsIndex(filename, full_scan_interval=-1)
+        assert jobs_index.GetJobs('jenkins_url', milky_way) is None
+        jobs_index.SetJobs('jenkins_url', milky_way, ['space-milky_way-mercury'], scanned=True)
+        assert jobs_index.GetJobs('jenkins_url', milky_way) is None
+        assert first_index.GetJobs('jenkins_url', milky_way) == {'space-milky_way-mercury'}
+
+
     def _GetPublisher(self):
         repository = Repository(url='http://server/space.git', branch='milky_way')
         jobs = [
@@ -2045,6 +2392,7 @@ class TestJenkinsPublisher(object):
             NEW_JOBS = set()
             UPDATED_JOBS = set()
             DELETED_JOBS = set()
+            CONFIG_REQUESTS = []
 
             def __init__(self, url, username, password):
                 assert url == 'jenkins_url'
@@ -2056,6 +2404,8 @@ class TestJenkinsPublisher(object):
                 return [{'name': 'space-milky_way-mercury'}, {'name': 'space-milky_way-saturn'}]
 
             def get_job_config(self, job_name):
+                self.CONFIG_REQUESTS.append(job_name)
+
                 # Test with single, and multiple scms
                 if job_name == 'space-milky_way-mercury':
                     return dedent(
@@ -2122,7 +2472,7 @@ class TestJenkinsPublisher(object):
                         '''
                     )
                 else:
-                    assert 0, f'unknown job name: {job_name}'
+                    raise jenkins.NotFoundException('Requested item could not be found')
 
             def create_job(self, name, xml):
                 assert type(xml) is str
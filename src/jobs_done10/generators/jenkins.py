@@ -5,32 +5,152 @@ This includes a generator, job publishers, constants and command line interface
 '''
 
 
+import functools
 import io
+import threading
 from collections import namedtuple
 
-from jobs_done10.common import AsList
+from jobs_done10.common import AsList, LruCache, SQLiteConnection
+from jobs_done10.job_generator import JobGeneratorConfigurator
 
 #===================================================================================================
 # JenkinsJob
 #===================================================================================================
-#
-# Represents a Jenkins job.
-#
-# :cvar unicode name:
-#     Job name
-#
-# :cvar Repository repository:
-#     Repository that this job belongs to
-#
-# :cvar unicode xml:
-#     Job XML contents
-JenkinsJob = namedtuple('JenkinsJob', 'name repository xml')
+class JenkinsJob(namedtuple('JenkinsJob', 'name repository xml')):
+    '''
+    Represents a Jenkins job: a (name, repository, xml) namedtuple.
+
+    The job XML can be given either as a string or as a producer of its contents in chunks: in the
+    latter case the XML is only built when `xml` is first accessed, and writing it with `WriteXml`
+    never builds the complete contents in memory. The tuple item of such lazy jobs is None, so
+    their contents must be obtained from the `xml` attribute (not by unpacking or indexing).
+
+    Jobs also have a `fingerprint` of their XML, so they can be compared with the configs obtained
+    from Jenkins (.. seealso:: GetXmlFingerprint); the producer computes it while producing the XML.
+    '''
+
+    _xml_producer = None
+    _produced_xml = None
+    _fingerprint = None
+
+    def __new__(cls, name, repository, xml=None, xml_producer=None, fingerprint=None):
+        '''
+        :param unicode name:
+            Job name
+
+        :param Repository repository:
+            Repository that this job belongs to
+
+        :param unicode|None xml:
+            Job XML contents
+
+        :param callable|None xml_producer:
+            Used when `xml` is not given: called with an `on_fingerprint` keyword argument, returns
+            an iterator over the job XML contents in chunks, calling `on_fingerprint` with the
+            fingerprint of the XML after the last one (for instance, `XmlFactory.IterContents`).
+
+        :param unicode|None fingerprint:
+            The fingerprint of the job XML, if already known.
+        '''
+        assert (xml is None) != (xml_producer is None), 'Either xml or xml_producer must be given'
+        job = super(JenkinsJob, cls).__new__(cls, name, repository, xml)
+        if xml_producer is not None:
+            job._xml_producer = xml_producer
+        if fingerprint is not None:
+            job._fingerprint = fingerprint
+        return job
+
+
+    def __getnewargs__(self):
+        # Copies and pickles of lazy jobs have their XML
+        return (self.name, self.repository, self.xml)
+
+
+    def _replace(self, **kwargs):
+        job = super(JenkinsJob, self)._replace(**kwargs)
+        if 'xml' not in kwargs:
+            job.__dict__.update(self.__dict__)
+        return job
+
+
+    @property
+    def xml(self):
+        '''
+        :return unicode:
+            Job XML contents
+        '''
+        xml = self._GetKnownXml()
+        if xml is None:
+            xml = self._produced_xml = ''.join(self._xml_producer(on_fingerprint=self._SetFingerprint))
+            self._xml_producer = None
+        return xml
+
+
+    @property
+    def fingerprint(self):
+        '''
+        :return unicode|None:
+            Fingerprint of the job XML (.. seealso:: GetXmlFingerprint), or None if the XML is not
+            valid.
+        '''
+        from xml.etree.ElementTree import ParseError
+        from jobs_done10.xml_factory import GetXmlFingerprint
+
+        if self._fingerprint is None:
+            xml = self._GetKnownXml()
+            if xml is None:
+                self.xml  # Computes the fingerprint along with the XML
+            else:
+                try:
+                    self._fingerprint = GetXmlFingerprint(xml)
+                except ParseError:
+                    return None
+        return self._fingerprint
+
+
+    def _GetKnownXml(self):
+        '''
+        :return unicode|None:
+            The job XML, or None if it was not produced yet.
+        '''
+        xml = tuple.__getitem__(self, 2)
+        if xml is None:
+            xml = self._produced_xml
+        return xml
+
+
+    def _SetFingerprint(self, fingerprint):
+        self._fingerprint = fingerprint
+
+
+    def IterXml(self):
+        '''
+        :return iter(unicode):
+            Job XML contents, in chunks.
+        '''
+        xml = self._GetKnownXml()
+        if xml is not None:
+            return iter((xml,))
+        return self._xml_producer(on_fingerprint=self._SetFingerprint)
+
+
+    def WriteXml(self, output):
+        '''
+        Writes the job XML encoded as UTF-8, in chunks.
+
+        :param output:
+            An object with a `write(bytes)` method (a file opened in binary mode, a gzip.GzipFile,
+            a socket file, etc).
+        '''
+        for chunk in self.IterXml():
+            output.write(chunk.encode('utf-8'))
 
 
 
 #===================================================================================================
 # JenkinsXmlJobGenerator
 #===================================================================================================
+@JobGeneratorConfigurator.Register
 class JenkinsXmlJobGenerator(object):
     '''
     Generates Jenkins jobs.
@@ -43,8 +163,32 @@ class JenkinsXmlJobGenerator(object):
 
         self.repository = None
 
+        # Base xml for jobs of `repository` (.. seealso:: Reset)
+        self._reset_template = None
+        self._reset_template_repository = None
+
 
     def Reset(self):
+        import copy
+        from jobs_done10.xml_factory import XmlFactory
+
+        # The base xml is the same for all jobs of a repository: build it once and copy it
+        template_repository = (self.repository.url, self.repository.branch)
+        if self._reset_template_repository != template_repository:
+            self._BuildBaseXml()
+            self._reset_template = copy.deepcopy(self.xml.root)
+            self._reset_template_repository = template_repository
+        else:
+            self.xml = XmlFactory(copy.deepcopy(self._reset_template))
+            self.git = self.xml['scm']
+
+        self.job_name = None
+
+
+    def _BuildBaseXml(self):
+        '''
+        Builds the xml common to all jobs of the current repository in `self.xml`.
+        '''
         from jobs_done10.xml_factory import XmlFactory
 
         self.xml = XmlFactory('project')
@@ -69,8 +213,6 @@ class JenkinsXmlJobGenerator(object):
             branch=self.repository.branch
         ))
 
-        self.job_name = None
-
 
     @classmethod
     def GetJobGroup(cls, repository):
@@ -88,8 +230,13 @@ class JenkinsXmlJobGenerator(object):
         return repository.name + '-' + repository.branch
 
 
-    def GetJob(self):
+    def GetJob(self, lazy=False):
         '''
+        :param bool lazy:
+            If True, the job XML is only produced when needed (.. seealso:: JenkinsJob), keeping the
+            xml tree of this generator until then. Only worthwhile when the job is written right away
+            (otherwise, the tree takes a lot more memory than the XML itself).
+
         :return JenkinsJob:
             Job created by this generator.
         '''
@@ -102,10 +249,21 @@ class JenkinsXmlJobGenerator(object):
                 publishers.remove(mailer)
                 publishers.append(mailer)
 
+        if lazy:
+            # Reset always starts a new tree, so this one is not changed anymore
+            return JenkinsJob(
+                name=self.job_name,
+                repository=self.repository,
+                xml_producer=functools.partial(self.xml.IterContents, xml_header=True),
+            )
+
+        fingerprints = []
+        xml = ''.join(self.xml.IterContents(xml_header=True, on_fingerprint=fingerprints.append))
         return JenkinsJob(
             name=self.job_name,
             repository=self.repository,
-            xml=self.xml.GetContents(xml_header=True)
+            xml=xml,
+            fingerprint=fingerprints[0],
         )
 
 
@@ -204,6 +362,8 @@ class JenkinsXmlJobGenerator(object):
         # Handle short mode where user only gives a list of recipients
         if isinstance(notification_info, str):
             notification_info = {'recipients' : notification_info}
+        else:
+            notification_info = dict(notification_info)  # Options are consumed below
 
         mailer['recipients'] = notification_info.pop('recipients')
 
@@ -231,6 +391,7 @@ class JenkinsXmlJobGenerator(object):
         if git_xml is None:
             git_xml = self.git
 
+        git_options = dict(git_options)  # Options are consumed below
         git_xml['configVersion'] = '2'
 
         def _Set(option, xml_path, default=None):
@@ -299,6 +460,7 @@ class JenkinsXmlJobGenerator(object):
             # username/password if the default configuration set in Jenkins server
             notifier['stashServerBaseUrl'] = args
         else:  # dict
+            args = dict(args)  # Options are consumed below
             notifier['stashServerBaseUrl'] = args.pop('url')
             notifier['stashUserName'] = args.pop('username', '')
             notifier['stashUserPassword'] = args.pop('password', '')
@@ -607,6 +769,20 @@ class JenkinsJobPublisher(object):
     # Times to sleep (seconds) between each retry
     RETRY_SLEEP = 1
 
+    # Maximum number of concurrent requests made to Jenkins while publishing
+    MAX_WORKERS = 4
+
+    # The branch of each job in Jenkins is cached (per Jenkins URL), so jobs known to belong to
+    # other branches (but whose names start like ours) are not downloaded and parsed again when the
+    # same repository/branch is published repeatedly. Configs themselves are never cached: other
+    # processes might change them at any time. Jobs changed by the publisher itself are removed from
+    # the cache.
+    BRANCH_CACHE_SIZE = 1000
+    BRANCH_CACHE_TTL = 300  # seconds
+
+    _branch_caches = {}
+    _branch_caches_lock = threading.Lock()
+
     def __init__(self, repository, jobs):
         '''
         :param Repository repository:
@@ -617,18 +793,22 @@ class JenkinsJobPublisher(object):
             List of jobs to be published.
         '''
         for job in jobs:
-            assert job.repository == repository, +\
+            assert job.repository == repository, \
                 'All published jobs must belong to the given `repository`'
 
         self.repository = repository
         self.jobs = dict((job.name, job) for job in jobs)
 
 
-    def PublishToUrl(self, url, username=None, password=None):
+    def PublishToUrl(self, url, username=None, password=None, max_workers=None, jobs_index=None):
         '''
         Publishes new jobs, updated existing jobs, and delete jobs that belong to the same
         repository/branch but were not updated.
 
+        Requests to Jenkins are made concurrently by a bounded pool of workers. A failure to publish
+        a job does not stop the others from being published: all failures are collected and raised
+        together in a `JenkinsPublishError` once every request has finished.
+
         :param unicode url:
             Jenkins instance URL where jobs will be uploaded to.
 
@@ -638,21 +818,57 @@ class JenkinsJobPublisher(object):
         :param unicode password:
             Jenkins password.
 
-        :return tuple(list(unicode),list(unicode),list(unicode)):
-            Tuple with lists of {new, updated, deleted} job names (sorted alphabetically)
+        :param int|None max_workers:
+            Maximum number of concurrent requests made to Jenkins. Defaults to `MAX_WORKERS`.
+
+        :param JenkinsJobsIndex|None jobs_index:
+            If given, the jobs that belong to our repository/branch are obtained from this index
+            instead of scanning every job in Jenkins (the scan is only done when the index knows
+            nothing about our repository/branch, or its last scan is too old). The index is updated
+            after publishing.
+
+        :return tuple(list(unicode),list(unicode),list(unicode),list(unicode)):
+            Tuple with lists of {new, updated, deleted, unchanged} job names (sorted alphabetically).
+
+            Unchanged jobs already exist in Jenkins with the exact same configuration, so they are
+            not uploaded again (which would needlessly bump their config history).
+
+        :raises JenkinsPublishError:
+            If any of the jobs could not be published.
         '''
         import jenkins
 
+        job_names = set(self.jobs.keys())
+        indexed_jobs = None
+        if jobs_index is not None:
+            indexed_jobs = jobs_index.GetJobs(url, self.repository)
+            if not job_names and indexed_jobs == set():
+                # Nothing to publish, and no jobs to delete: no need to talk to Jenkins at all
+                return [[], [], [], []]
+
         jenkins_api = jenkins.Jenkins(url, username, password)
 
+        branch_cache = self._GetBranchCache(url)
+
         # Get all jobs
-        job_names = set(self.jobs.keys())
-        matching_jobs = self._GetMatchingJobs(jenkins_api)
+        if indexed_jobs is None:
+            matching_jobs = self._GetMatchingJobs(jenkins_api, branch_cache)
+        else:
+            # Jobs we are about to publish might exist even if they are not in the index yet
+            matching_jobs = self._GetMatchingIndexedJobs(
+                jenkins_api, branch_cache, indexed_jobs.union(job_names))
 
         # Find all new/updated/deleted jobs
         new_jobs = job_names.difference(matching_jobs)
         updated_jobs = job_names.intersection(matching_jobs)
-        deleted_jobs = matching_jobs.difference(job_names)
+        deleted_jobs = set(matching_jobs).difference(job_names)
+
+        # Skip jobs whose configuration did not change
+        unchanged_jobs = set(
+            job_name for job_name in updated_jobs
+            if self._IsUnchanged(self.jobs[job_name], matching_jobs[job_name])
+        )
+        updated_jobs.difference_update(unchanged_jobs)
 
         def retry(func, *args, **kwargs):
             from requests.exceptions import HTTPError
@@ -672,17 +888,50 @@ class JenkinsJobPublisher(object):
                 # If we got here, this mean we ran out of retries. Raise the last error we received.
                 raise http_error
 
+        def publish(func, job_name, *args):
+            try:
+                retry(func, job_name, *args)
+            finally:
+                # Whatever happened, our cached branch for this job can't be trusted anymore
+                branch_cache.Invalidate((job_name, self.repository.url))
+
         # Process everything
-        for job_name in new_jobs:
-            retry(jenkins_api.create_job, job_name, self.jobs[job_name].xml)
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers or self.MAX_WORKERS) as executor:
+            futures = []
+            for job_name in sorted(new_jobs):
+                future = executor.submit(publish, jenkins_api.create_job, job_name, self.jobs[job_name].xml)
+                futures.append((job_name, future))
+
+            for job_name in sorted(updated_jobs):
+                future = executor.submit(publish, jenkins_api.reconfig_job, job_name, self.jobs[job_name].xml)
+                futures.append((job_name, future))
+
+            for job_name in sorted(deleted_jobs):
+                future = executor.submit(publish, jenkins_api.delete_job, job_name)
+                futures.append((job_name, future))
+
+        errors = {}
+        for job_name, future in futures:
+            exception = future.exception()
+            if exception is not None:
+                errors[job_name] = exception
+
+        result = [
+            sorted(job_name for job_name in jobs if job_name not in errors)
+            for jobs in (new_jobs, updated_jobs, deleted_jobs, unchanged_jobs)
+        ]
 
-        for job_name in updated_jobs:
-            retry(jenkins_api.reconfig_job, job_name, self.jobs[job_name].xml)
+        if jobs_index is not None:
+            # Jobs that failed to be deleted are still around
+            owned_jobs = job_names.union(deleted_jobs).difference(result[2])
+            jobs_index.SetJobs(url, self.repository, owned_jobs, scanned=indexed_jobs is None)
 
-        for job_name in deleted_jobs:
-            retry(jenkins_api.delete_job, job_name)
+        if errors:
+            raise JenkinsPublishError(url, errors, *result)
 
-        return list(map(sorted, (new_jobs, updated_jobs, deleted_jobs)))
+        return result
 
 
     def PublishToDirectory(self, output_directory):
@@ -692,23 +941,72 @@ class JenkinsJobPublisher(object):
         :param unicode output_directory:
              Target directory for outputting job .xmls
         '''
-        import os
-        for job in self.jobs.values():
-            with io.open(os.path.join(output_directory, job.name), 'w', encoding='utf-8') as f:
-                f.write(job.xml)
+        PublishJobsToDirectory(self.repository, self.jobs.values(), output_directory)
+
+
+    @classmethod
+    def ClearBranchCache(cls):
+        '''
+        Forgets all job branches cached from every Jenkins instance.
+        '''
+        with cls._branch_caches_lock:
+            cls._branch_caches.clear()
+
+
+    @classmethod
+    def _GetBranchCache(cls, url):
+        '''
+        :param unicode url:
+            Jenkins instance URL.
+
+        :return LruCache:
+            Cache of the branches of jobs in the given Jenkins instance, keyed by job name and
+            repository url.
+        '''
+        with cls._branch_caches_lock:
+            try:
+                return cls._branch_caches[url]
+            except KeyError:
+                branch_cache = LruCache(max_size=cls.BRANCH_CACHE_SIZE, ttl=cls.BRANCH_CACHE_TTL)
+                cls._branch_caches[url] = branch_cache
+                return branch_cache
+
+
+    def _IsUnchanged(self, job, job_config):
+        '''
+        :param JenkinsJob job:
+            A job being published.
 
+        :param _JobConfig job_config:
+            The current config of the same job in Jenkins.
 
-    def _GetMatchingJobs(self, jenkins_api):
+        :return bool:
+            If the job in Jenkins already has the same configuration, comparing fingerprints (jobs
+            or configs which are not valid XML are compared by their contents).
+        '''
+        fingerprint = job_config.fingerprint
+        if fingerprint is not None:
+            job_fingerprint = job.fingerprint
+            if job_fingerprint is not None:
+                return job_fingerprint == fingerprint
+        return job.xml == job_config.config
+
+
+    def _GetMatchingJobs(self, jenkins_api, branch_cache):
         '''
         Filter jobs that belong to the same repository/branch as a `job` being published
 
         :param jenkins_api:
             Configured Jenkins API that gives access to Jenkins data at a host.
 
-        :return set(unicode):
-            Names of all Jenkins jobs that match `job` repository name and branch
+        :param LruCache branch_cache:
+            .. seealso:: _GetMatchingJobConfig
+
+        :return dict(unicode,_JobConfig):
+            Maps the names of all Jenkins jobs that match `job` repository name and branch to their
+            current config.xml.
         '''
-        matching_jobs = set()
+        matching_jobs = {}
 
         common_prefix = self.repository.name + '-' + self.repository.branch
         for jenkins_job in (x['name'] for x in jenkins_api.get_jobs()):
@@ -717,32 +1015,83 @@ class JenkinsJobPublisher(object):
             if not jenkins_job.startswith(common_prefix):
                 continue
 
-            jenkins_job_branch = self._GetJenkinsJobBranch(jenkins_api, jenkins_job)
-            if jenkins_job_branch == self.repository.branch:
-                matching_jobs.add(jenkins_job)
+            # Read config to see if this job is in the same branch
+            job_config = self._GetMatchingJobConfig(jenkins_api, branch_cache, jenkins_job)
+            if job_config is not None:
+                matching_jobs[jenkins_job] = job_config
+
+        return matching_jobs
+
+
+    def _GetMatchingIndexedJobs(self, jenkins_api, branch_cache, jenkins_jobs):
+        '''
+        Same as `_GetMatchingJobs`, but only considers the given jobs instead of every job in
+        Jenkins.
+
+        :param iter(unicode) jenkins_jobs:
+            Names of jobs that might belong to our repository/branch. Jobs that do not exist in
+            Jenkins are ignored.
+        '''
+        import jenkins
+
+        matching_jobs = {}
+        for jenkins_job in sorted(jenkins_jobs):
+            try:
+                job_config = self._GetMatchingJobConfig(jenkins_api, branch_cache, jenkins_job)
+            except jenkins.NotFoundException:
+                continue
+
+            if job_config is not None:
+                matching_jobs[jenkins_job] = job_config
 
         return matching_jobs
 
 
-    def _GetJenkinsJobBranch(self, jenkins_api, jenkins_job):
+    def _GetMatchingJobConfig(self, jenkins_api, branch_cache, jenkins_job):
         '''
         :param jenkins.Jenkins jenkins_api:
             Configured Jenkins API that gives access to Jenkins data at a host.
 
+        :param LruCache branch_cache:
+            Cache for the branches of jobs in the same Jenkins instance as `jenkins_api`.
+
         :param unicode jenkins_job:
             Name of a job in jenkins
 
-        :return unicode:
-            Name of `jenkins_job`s branch
+        :return _JobConfig|None:
+            The current config.xml of `jenkins_job`, or None if it belongs to another branch.
 
         .. note::
-            This function was separated to make use of Memoize cacheing, avoiding multiple queries
-            to the same jenkins job config.xml
+            The config of a job is always obtained from Jenkins (so jobs are classified as
+            new/updated/unchanged by their current config), unless `branch_cache` knows the job
+            belongs to another branch and we are not publishing it.
         '''
-        from xml.etree import ElementTree
+        key = (jenkins_job, self.repository.url)
+        if jenkins_job not in self.jobs:
+            cached_branch = branch_cache.Get(key)
+            if cached_branch is not None and cached_branch != self.repository.branch:
+                return None
+
+        job_config = _JobConfig(jenkins_api.get_job_config(jenkins_job))
+        jenkins_job_branch = self._GetJenkinsJobBranch(jenkins_job, job_config.config)
+        branch_cache.Set(key, jenkins_job_branch)
+        if jenkins_job_branch != self.repository.branch:
+            return None
+        return job_config
+
 
-        # Read config to see if this job is in the same branch
-        config = jenkins_api.get_job_config(jenkins_job)
+    def _GetJenkinsJobBranch(self, jenkins_job, config):
+        '''
+        :param unicode jenkins_job:
+            Name of a job in jenkins
+
+        :param unicode config:
+            Contents of `jenkins_job` config.xml
+
+        :return unicode:
+            Name of `jenkins_job`s branch
+        '''
+        from xml.etree import ElementTree
 
         # We should be able to get this information from jenkins API, but it seems that git
         # plugin for Jenkins has a bug that prevents its data from being shown in the API
@@ -795,10 +1144,251 @@ class JenkinsJobPublisher(object):
 
 
 
+#===================================================================================================
+# _JobConfig
+#===================================================================================================
+class _JobConfig(object):
+    '''
+    A job config.xml obtained from Jenkins by `JenkinsJobPublisher`.
+
+    :ivar unicode config:
+        Contents of config.xml
+    '''
+
+    def __init__(self, config):
+        self.config = config
+        self._fingerprint = None
+        self._fingerprint_computed = False
+
+
+    @property
+    def fingerprint(self):
+        '''
+        :return unicode|None:
+            Fingerprint of config.xml (.. seealso:: GetXmlFingerprint), or None if it is not valid
+            XML. Memoized, so the config is only parsed once.
+        '''
+        from xml.etree.ElementTree import ParseError
+        from jobs_done10.xml_factory import GetXmlFingerprint
+
+        if not self._fingerprint_computed:
+            try:
+                self._fingerprint = GetXmlFingerprint(self.config)
+            except ParseError:
+                self._fingerprint = None
+            self._fingerprint_computed = True
+        return self._fingerprint
+
+
+
+#===================================================================================================
+# JenkinsJobsIndex
+#===================================================================================================
+class JenkinsJobsIndex(object):
+    '''
+    Persistent index of the jobs published for each repository/branch in Jenkins instances.
+
+    Finding which jobs belong to a repository/branch otherwise requires listing every job in
+    Jenkins, which is really slow in big instances. .. seealso:: JenkinsJobPublisher.PublishToUrl
+
+    The index is kept in a SQLite database, so it can be shared by many processes: each update is
+    made in a transaction, without losing the updates of other processes.
+
+    Jobs missing from the index (created by someone else, or by a publish that failed before
+    updating the index) would never be deleted, so each repository/branch is considered missing
+    from the index once its jobs were last obtained by scanning Jenkins more than
+    `full_scan_interval` seconds ago: the next publish scans Jenkins again.
+    '''
+
+    # Seconds between full scans of the jobs in Jenkins for each repository/branch
+    FULL_SCAN_INTERVAL = 24 * 60 * 60
+
+    def __init__(self, filename, full_scan_interval=None):
+        '''
+        :param unicode filename:
+            Path to the SQLite database where the index is stored (created if it does not exist).
+
+        :param float|None full_scan_interval:
+            Defaults to `FULL_SCAN_INTERVAL`.
+        '''
+        self.filename = filename
+        if full_scan_interval is None:
+            full_scan_interval = self.FULL_SCAN_INTERVAL
+        self.full_scan_interval = full_scan_interval
+
+        with self._Connect() as connection:
+            connection.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS branches (
+                    url TEXT NOT NULL,
+                    repository_url TEXT NOT NULL,
+                    branch TEXT NOT NULL,
+                    scanned REAL NOT NULL,
+                    PRIMARY KEY (url, repository_url, branch)
+                )
+                '''
+            )
+            connection.execute(
+                '''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    url TEXT NOT NULL,
+                    repository_url TEXT NOT NULL,
+                    branch TEXT NOT NULL,
+                    job_name TEXT NOT NULL,
+                    PRIMARY KEY (url, repository_url, branch, job_name)
+                )
+                '''
+            )
+
+
+    def GetJobs(self, url, repository):
+        '''
+        :param unicode url:
+            Jenkins instance URL.
+
+        :param Repository repository:
+            Repository/branch that owns the jobs.
+
+        :return set(unicode)|None:
+            Names of jobs published for `repository` in Jenkins, or None if `repository` is not
+            in the index (or is due to a full scan).
+        '''
+        import time
+
+        key = (url, repository.url, repository.branch)
+        with self._Connect() as connection:
+            row = connection.execute(
+                'SELECT scanned FROM branches WHERE url = ? AND repository_url = ? AND branch = ?',
+                key,
+            ).fetchone()
+            if row is None or time.time() - row[0] > self.full_scan_interval:
+                return None
+            rows = connection.execute(
+                'SELECT job_name FROM jobs WHERE url = ? AND repository_url = ? AND branch = ?',
+                key,
+            ).fetchall()
+        return set(job_name for (job_name,) in rows)
+
+
+    def SetJobs(self, url, repository, job_names, scanned=False):
+        '''
+        Updates the jobs published for `repository` in Jenkins.
+
+        :param unicode url:
+            .. seealso:: GetJobs
+
+        :param Repository repository:
+            .. seealso:: GetJobs
+
+        :param iter(unicode) job_names:
+            Names of jobs published for `repository`.
+
+        :param bool scanned:
+            If `job_names` were obtained by scanning every job in Jenkins (otherwise, the time of
+            the last full scan is kept).
+        '''
+        import time
+
+        key = (url, repository.url, repository.branch)
+        with self._Connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            if scanned:
+                connection.execute(
+                    'INSERT OR REPLACE INTO branches (url, repository_url, branch, scanned) '
+                    'VALUES (?, ?, ?, ?)',
+                    key + (time.time(),),
+                )
+            else:
+                connection.execute(
+                    'INSERT OR IGNORE INTO branches (url, repository_url, branch, scanned) '
+                    'VALUES (?, ?, ?, ?)',
+                    key + (time.time(),),
+                )
+            connection.execute(
+                'DELETE FROM jobs WHERE url = ? AND repository_url = ? AND branch = ?',
+                key,
+            )
+            connection.executemany(
+                'INSERT INTO jobs (url, repository_url, branch, job_name) VALUES (?, ?, ?, ?)',
+                [key + (job_name,) for job_name in sorted(job_names)],
+            )
+
+
+    def _Connect(self):
+        '''
+        :rtype: SQLiteConnection
+        '''
+        return SQLiteConnection(self.filename)
+
+
+
+#===================================================================================================
+# JenkinsPublishError
+#===================================================================================================
+class JenkinsPublishError(RuntimeError):
+    '''
+    Raised when one or more jobs could not be published to a Jenkins instance.
+
+    :ivar dict(unicode,Exception) errors:
+        Maps the names of jobs that failed to the exception raised while publishing them.
+
+    :ivar list(unicode) new_jobs:
+    :ivar list(unicode) updated_jobs:
+    :ivar list(unicode) deleted_jobs:
+    :ivar list(unicode) unchanged_jobs:
+        Jobs that were successfully published (or skipped) before the error was raised.
+        .. seealso:: JenkinsJobPublisher.PublishToUrl
+    '''
+    def __init__(self, url, errors, new_jobs, updated_jobs, deleted_jobs, unchanged_jobs):
+        import traceback
+
+        self.errors = errors
+        self.new_jobs = new_jobs
+        self.updated_jobs = updated_jobs
+        self.deleted_jobs = deleted_jobs
+        self.unchanged_jobs = unchanged_jobs
+
+        lines = ['Failed to publish %d job(s) to "%s":' % (len(errors), url)]
+        for job_name, exception in sorted(errors.items()):
+            lines.append('')
+            lines.append('- %s:' % job_name)
+            lines.extend(
+                '    ' + line
+                for chunk in traceback.format_exception(type(exception), exception, exception.__traceback__)
+                for line in chunk.rstrip('\n').splitlines()
+            )
+        RuntimeError.__init__(self, '\n'.join(lines))
+
+
+
 #===================================================================================================
 # Actions for common uses of Jenkins classes
 #===================================================================================================
-def UploadJobsFromFile(repository, jobs_done_file_contents, url, username=None, password=None):
+def PublishJobsToDirectory(repository, jobs, output_directory):
+    '''
+    Same as `JenkinsJobPublisher.PublishToDirectory`, but writes jobs as they are obtained from
+    `jobs`, which may be an iterator (for instance, from `IterJobsFromFile`).
+
+    :param Repository repository:
+        .. seealso:: JenkinsJobPublisher
+
+    :param iter(JenkinsJob) jobs:
+        Jobs to be published.
+
+    :param unicode output_directory:
+        .. seealso:: JenkinsJobPublisher.PublishToDirectory
+    '''
+    import os
+    for job in jobs:
+        assert job.repository == repository, \
+            'All published jobs must belong to the given `repository`'
+        with io.open(os.path.join(output_directory, job.name), 'wb') as f:
+            job.WriteXml(f)
+
+
+
+def UploadJobsFromFile(repository, jobs_done_file_contents, url, username=None, password=None,
+                       jobs_index=None):
     '''
     :param repository:
         .. seealso:: GetJobsFromFile
@@ -815,6 +1405,9 @@ def UploadJobsFromFile(repository, jobs_done_file_contents, url, username=None,
     :param unicode|None password:
         Password for Jenkins server.
 
+    :param JenkinsJobsIndex|None jobs_index:
+        .. seealso:: JenkinsJobPublisher.PublishToUrl
+
     :returns:
         .. seealso:: JenkinsJobPublisher.PublishToUrl
 
@@ -822,7 +1415,7 @@ def UploadJobsFromFile(repository, jobs_done_file_contents, url, username=None,
     jobs = GetJobsFromFile(repository, jobs_done_file_contents)
     publisher = JenkinsJobPublisher(repository, jobs)
 
-    return publisher.PublishToUrl(url, username, password)
+    return publisher.PublishToUrl(url, username, password, jobs_index=jobs_index)
 
 
 
@@ -833,11 +1426,34 @@ def GetJobsFromDirectory(directory='.'):
     :param directory:
         Directory where we'll extract information to generate `JenkinsJob`s
 
-    :return tuple(Repository,set(JenkinsJob))
+    :return tuple(Repository,list(JenkinsJob))
         Repository information for the given directory, and jobs obtained from this directory.
 
         .. seealso:: GetJobsFromFile
     '''
+    repository, jobs_done_file_contents = _ReadDirectory(directory)
+    return repository, GetJobsFromFile(repository, jobs_done_file_contents)
+
+
+
+def IterJobsFromDirectory(directory='.'):
+    '''
+    Same as `GetJobsFromDirectory`, but jobs are created lazily.
+
+    :return tuple(Repository,iter(JenkinsJob))
+        .. seealso:: IterJobsFromFile
+    '''
+    repository, jobs_done_file_contents = _ReadDirectory(directory)
+    return repository, IterJobsFromFile(repository, jobs_done_file_contents)
+
+
+
+def _ReadDirectory(directory):
+    '''
+    :return tuple(Repository,unicode|None):
+        Repository information for the given directory, and the contents of its jobs_done file
+        (None if there is none).
+    '''
     from jobs_done10.jobs_done_job import JOBS_DONE_FILENAME
     from jobs_done10.repository import Repository
     import os
@@ -859,8 +1475,7 @@ def GetJobsFromDirectory(directory='.'):
             jobs_done_file_contents = f.read()
     except IOError:
         jobs_done_file_contents = None
-
-    return repository, GetJobsFromFile(repository, jobs_done_file_contents)
+    return repository, jobs_done_file_contents
 
 
 
@@ -874,17 +1489,39 @@ def GetJobsFromFile(repository, jobs_done_file_contents):
     :param unicode|None jobs_done_file_contents:
         .. seealso:: JobsDoneJob.CreateFromYAML
 
-    :return set(JenkinsJob)
+    :return list(JenkinsJob)
     '''
-    from jobs_done10.job_generator import JobGeneratorConfigurator
     from jobs_done10.jobs_done_job import JobsDoneJob
 
-    jenkins_generator = JenkinsXmlJobGenerator()
-
-    jobs = []
     jobs_done_jobs = JobsDoneJob.CreateFromYAML(jobs_done_file_contents, repository)
+    return list(_IterJenkinsJobs(jobs_done_jobs, lazy=False))
+
+
+
+def IterJobsFromFile(repository, jobs_done_file_contents):
+    '''
+    Same as `GetJobsFromFile`, but yields jobs one at a time, so only one job (and its xml) is kept
+    in memory at a time. The XML of each job is only produced when needed, so it can be written
+    directly to a file (.. seealso:: PublishJobsToDirectory).
+
+    :rtype: iter(JenkinsJob)
+    '''
+    from jobs_done10.jobs_done_job import JobsDoneJob
+
+    return _IterJenkinsJobs(JobsDoneJob.IterFromYAML(jobs_done_file_contents, repository), lazy=True)
+
+
+
+def _IterJenkinsJobs(jobs_done_jobs, lazy):
+    '''
+    :param iter(JobsDoneJob) jobs_done_jobs:
+
+    :param bool lazy:
+        .. seealso:: JenkinsXmlJobGenerator.GetJob
+
+    :rtype: iter(JenkinsJob)
+    '''
+    jenkins_generator = JenkinsXmlJobGenerator()
     for jobs_done_job in jobs_done_jobs:
         JobGeneratorConfigurator.Configure(jenkins_generator, jobs_done_job)
-        jobs.append(jenkins_generator.GetJob())
-
-    return jobs
+        yield jenkins_generator.GetJob(lazy=lazy)
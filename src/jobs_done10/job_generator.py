@@ -64,6 +64,9 @@ class JobGeneratorConfigurator(object):
     .. seealso:: IJobGenerator
     '''
 
+    # Maps generator classes to their setters (.. seealso:: _GetSetters)
+    _setters = {}
+
     @classmethod
     def Configure(cls, generator, jobs_done_job):
         '''
@@ -81,23 +84,89 @@ class JobGeneratorConfigurator(object):
         generator.Reset()
         generator.SetMatrix(jobs_done_job.matrix, jobs_done_job.matrix_row)
 
-        for option in jobs_done_job.GENERATOR_OPTIONS:
+        for option, setter in cls._GetSetters(generator.__class__):
             option_value = getattr(jobs_done_job, option)
-            if option_value is None:
-                continue  # Skip unset options
+            if option_value is not None:  # Skip unset options
+                setter(generator, option_value)
+
+        return generator
+
 
-            # Find function name associated with the option being processed
-            generator_function_name = 'Set' + option.title().replace('_', '')
+    @classmethod
+    def Register(cls, generator_class):
+        '''
+        Class decorator for generators which handle all options: raises `JobGeneratorAttributeError`
+        right away (when the generator class is defined) if any of the functions is missing.
 
-            # Obtain and call that function with the option value
-            try:
-                generator_function = getattr(generator, generator_function_name)
-            except AttributeError:
-                raise JobGeneratorAttributeError(generator, generator_function_name, option)
+        :param type generator_class:
+            An `IJobGenerator` implementation.
 
-            generator_function(option_value)
+        :return type:
+            `generator_class`
+        '''
+        for option, setter in cls._GetSetters(generator_class):
+            if isinstance(setter, _MissingSetter):
+                raise JobGeneratorAttributeError(generator_class, setter.setter_name, option)
+        return generator_class
 
-        return generator
+
+    @classmethod
+    def GetSetterName(cls, option):
+        '''
+        :param unicode option:
+            A JobsDoneJob option (e.g. 'junit_patterns').
+
+        :return unicode:
+            Name of the generator function which handles the option (e.g. 'SetJunitPatterns').
+        '''
+        return 'Set' + option.title().replace('_', '')
+
+
+    @classmethod
+    def _GetSetters(cls, generator_class):
+        '''
+        :param type generator_class:
+
+        :return list(tuple(unicode,callable)):
+            For each option in `JobsDoneJob.GENERATOR_OPTIONS`, the generator function (unbound,
+            called with the generator and the option value) which handles it. Functions missing
+            from `generator_class` are replaced by a `_MissingSetter`. Computed once for each
+            generator class.
+        '''
+        try:
+            return cls._setters[generator_class]
+        except KeyError:
+            from jobs_done10.jobs_done_job import JobsDoneJob
+
+            setters = []
+            for option in JobsDoneJob.GENERATOR_OPTIONS:
+                setter_name = cls.GetSetterName(option)
+                setter = getattr(generator_class, setter_name, None)
+                if setter is None:
+                    setter = _MissingSetter(setter_name, option)
+                setters.append((option, setter))
+            cls._setters[generator_class] = setters
+            return setters
+
+
+
+#===================================================================================================
+# _MissingSetter
+#===================================================================================================
+class _MissingSetter(object):
+    '''
+    Stands for a generator function missing from a generator class: generators which are not
+    registered (.. seealso:: JobGeneratorConfigurator.Register) only fail when configured with an
+    option they cannot handle.
+    '''
+
+    def __init__(self, setter_name, option):
+        self.setter_name = setter_name
+        self.option = option
+
+
+    def __call__(self, generator, option_value):
+        raise JobGeneratorAttributeError(generator, self.setter_name, self.option)
 
 
 
@@ -109,7 +178,12 @@ class JobGeneratorAttributeError(AttributeError):
     Raised when trying to access a generator function that is not implemented.
     '''
     def __init__(self, generator, attribute, jobs_done_job_option):
+        '''
+        :param IJobGenerator|type generator:
+            The generator (or generator class) missing a function.
+        '''
+        generator_class = generator if isinstance(generator, type) else generator.__class__
         message = '%s "%s" cannot handle option "%s" (could not find function "%s").' % \
-            (IJobGenerator.__name__, generator.__class__.__name__, jobs_done_job_option, attribute)
+            (IJobGenerator.__name__, generator_class.__name__, jobs_done_job_option, attribute)
 
         AttributeError.__init__(self, message)
@@ -1,5 +1,6 @@
 
 
+import functools
 import io
 
 import yaml
@@ -223,18 +224,36 @@ class JobsDoneJob(object):
     })
 
 
+    # One instance is created for each matrix row, so keep them compact: options not set are not
+    # stored at all (.. seealso:: __getattr__)
+    __slots__ = tuple(sorted(PARSEABLE_OPTIONS)) + ('matrix_row', 'repository')
+
+    # Maximum number of jobs_done files whose jobs are kept in cache by `CreateFromYAML`
+    JOBS_CACHE_SIZE = 64
+
+    _jobs_cache = None
+
+
     def __init__(self):
         '''
         :ivar dict(unicode,unicode) matrix_row:
             A dict that represents a single row from this file's `matrix`.
 
             .. seealso:: `matrix`@PARSEABLE_OPTIONS
+
+        :ivar Repository repository:
+            Repository for which this job is created.
+
+        Known options not set are None.
         '''
         self.matrix_row = None
 
-        # Initialize known options with None
-        for option_name in self.PARSEABLE_OPTIONS:
-            setattr(self, option_name, None)
+
+    def __getattr__(self, name):
+        # Only called for slots not set
+        if name in self.__slots__:
+            return None
+        raise AttributeError("'%s' object has no attribute '%s'" % (self.__class__.__name__, name))
 
 
     @classmethod
@@ -262,6 +281,10 @@ class JobsDoneJob(object):
         :return list(JobsDoneJob):
             List of jobs created for parameters.
 
+            Jobs are cached and shared with other callers (and jobs expanded from the same file share
+            option values which do not depend on the matrix row), so they must not be changed: copy
+            any value before changing it.
+
         .. seealso:: JobsDoneJob
             For known options accepted in yaml_contents
 
@@ -288,14 +311,102 @@ class JobsDoneJob(object):
         if yaml_contents is None:
             return []
 
-        # Avoid errors with tabs at the end of file
-        yaml_contents = yaml_contents.strip()
+        # Most pushes do not change the jobs_done file, so jobs are cached by the file's contents
+        # (and the repository information used to expand it). Cached jobs are returned as they are:
+        # callers must not change them.
+        cache = cls._GetJobsCache()
+        key = cls._GetJobsCacheKey(yaml_contents, repository)
+        jobs_done_jobs = cache.Get(key)
+        if jobs_done_jobs is None:
+            jobs_done_jobs = cls._CreateFromYAML(yaml_contents, repository)
+            cache.Set(key, jobs_done_jobs)
+        return list(jobs_done_jobs)
+
+
+    @classmethod
+    def IterFromYAML(cls, yaml_contents, repository):
+        '''
+        Same as `CreateFromYAML`, but yields jobs one matrix row at a time, instead of creating all
+        of them up front. Useful to keep memory usage low for very large matrices.
+
+        Note that errors in `yaml_contents` are only raised when iteration starts, and that (as with
+        `CreateFromYAML`) jobs might be shared, so they must not be changed.
+
+        :param unicode yaml_contents:
+            .. seealso:: CreateFromYAML
+
+        :param Repository repository:
+            .. seealso:: CreateFromYAML
+
+        :rtype: iter(JobsDoneJob)
+        '''
+        if yaml_contents is None:
+            return
+
+        # Only use jobs already in cache: streamed jobs are not kept
+        jobs_done_jobs = cls._GetJobsCache().Get(cls._GetJobsCacheKey(yaml_contents, repository))
+        if jobs_done_jobs is not None:
+            for jobs_done_job in jobs_done_jobs:
+                yield jobs_done_job
+        else:
+            for jobs_done_job in cls._IterFromYAML(yaml_contents, repository):
+                yield jobs_done_job
+
 
+    @classmethod
+    def _GetJobsCache(cls):
+        from jobs_done10.common import LruCache
+
+        if cls._jobs_cache is None:
+            cls._jobs_cache = LruCache(max_size=cls.JOBS_CACHE_SIZE)
+        return cls._jobs_cache
+
+
+    @classmethod
+    def _GetJobsCacheKey(cls, yaml_contents, repository):
+        import hashlib
+
+        return (
+            hashlib.sha1(yaml_contents.encode('utf-8')).hexdigest(),
+            repository.url,
+            repository.branch,
+        )
+
+
+    @classmethod
+    def ClearCache(cls):
+        '''
+        Clears the jobs cached by `CreateFromYAML` (and the files cached by `LoadYAML`).
+        '''
+        if cls._jobs_cache is not None:
+            cls._jobs_cache.Clear()
+        if _load_yaml_cache is not None:
+            _load_yaml_cache.Clear()
+
+
+    @classmethod
+    def _CreateFromYAML(cls, yaml_contents, repository):
+        '''
+        Implementation of `CreateFromYAML`, without caching.
+        '''
+        return list(cls._IterFromYAML(yaml_contents, repository))
+
+
+    @classmethod
+    def _IterFromYAML(cls, yaml_contents, repository):
+        '''
+        Implementation of `IterFromYAML`, without caching.
+        '''
         # Load yaml
-        jd_data = yaml.load(yaml_contents, Loader=yaml.loader.BaseLoader)
+        jd_data = LoadYAML(yaml_contents)
         if not jd_data:
             raise ValueError('Could not parse anything from .yaml contents')
 
+        # Most branches usually do not have jobs: return right away if that is decided by the
+        # top-level branch_patterns alone, skipping validation and matrix expansion.
+        if cls._IsBranchExcluded(jd_data, repository):
+            return
+
         # Search for unknown options and type errors
         for option_name, option_value in jd_data.items():
             option_name = option_name.rsplit(':', 1)[-1]
@@ -309,93 +420,249 @@ class JobsDoneJob(object):
                 raise JobsDoneFileTypeError(option_name, obtained_type, expected_types, option_value)
 
         # List all possible matrix_rows
-        matrix_rows = cls._MatrixRow.CreateFromDict(jd_data.get('matrix', {}))
+        matrix_rows = cls._MatrixRow.IterFromDict(jd_data.get('matrix', {}))
 
         ignore_unmatchable = Boolean(jd_data.get('ignore_unmatchable', 'false'))
         if not ignore_unmatchable:
-            # Raise an error if a condition can never be matched
+            # Raise an error if a condition can never be matched. Matrix rows are all combinations of
+            # the matrix values, so this is decided for each variable, without going through all rows.
+            variables_values = cls._GetMatrixValues(jd_data.get('matrix', {}))
+            has_matrix_rows = all(variables_values.values())
+            variables_values['branch'] = cls._MATCH_ANY
             for yaml_dict in cls._IterDicts(jd_data):
                 for key, _value in yaml_dict.items():
                     if ':' in key:
-                        conditions = key.split(':')[:-1]
+                        _conditions, compiled_conditions, _option_name = cls._ParseConditionalKey(key)
 
-                        for row in matrix_rows:
-                            if cls._MatchConditions(conditions, row.full_dict, branch=cls._MATCH_ANY):
-                                break
-                        else:
+                        if not has_matrix_rows or not cls._IsMatchable(compiled_conditions, variables_values):
                             raise UnmatchableConditionError(key)
 
-        import re
-        jobs_done_jobs = []
-        for matrix_row in matrix_rows:
-            jobs_done_job = JobsDoneJob()
-
-            jobs_done_job.repository = repository
-            jobs_done_job.matrix_row = matrix_row.simple_dict
+        jd_constant, jd_template = cls._CompileYAMLData(jd_data)
+        repository_format_dict = {
+            'branch':repository.branch,
+            'name':repository.name
+        }
+
+        # Options which decide if a matrix row creates a job at all are resolved first, so rows
+        # that are excluded (or do not match the branch) skip the full expansion
+        filter_data = {
+            key: value
+            for key, value in jd_data.items()
+            if key.rsplit(':', 1)[-1] in ('exclude', 'branch_patterns')
+        }
+        filter_constant, filter_template = cls._CompileYAMLData(filter_data)
+        interned_values = {}
 
+        for matrix_row in matrix_rows:
             # Re-read jd_data replacing all matrix variables with their values in the current
             # matrix_row and special replacement variables 'branch' and 'name', based on repository.
-            format_dict = {
-                'branch':repository.branch,
-                'name':repository.name
-            }
-            format_dict.update(matrix_row.simple_dict)
-            jd_formatted_data = cls._GetFormattedYAMLData(jd_data, format_dict)
+            format_dict = dict(repository_format_dict, **matrix_row.simple_dict)
+            facts = dict(matrix_row.full_dict, branch=[repository.branch])
+
+            if filter_data:
+                filter_formatted_data = filter_template if filter_constant else filter_template(format_dict)
+                cls._ResolveConditions(filter_formatted_data, facts)
+                if not cls._ShouldCreateJob(filter_formatted_data, repository.branch):
+                    continue
+
+            jd_formatted_data = jd_template if jd_constant else jd_template(format_dict)
             # Re-write formatted_data dict ignoring/replacing dict keys based on matrix
             for yaml_dict in cls._IterDicts(jd_formatted_data):
-                matched_conditions = {}
-                for key, option_value in list(yaml_dict.items()):
-                    if ':' not in key:
-                        continue
+                cls._ResolveConditions(yaml_dict, facts)
+
+            # Set surviving options in job. Options with the same value in many rows (usually most
+            # of them) are shared by the jobs.
+            jobs_done_job = JobsDoneJob()
+            jobs_done_job.repository = repository
+            jobs_done_job.matrix_row = matrix_row.simple_dict
+            for option_name, option_value in jd_formatted_data.items():
+                setattr(jobs_done_job, option_name, cls._InternValue(option_value, interned_values))
+
+            yield jobs_done_job
 
-                    conditions = key.split(':')[:-1]
-                    option_name = key.split(':')[-1]
 
-                    # Remove the key with condition text
-                    del yaml_dict[key]
+    @classmethod
+    def _InternValue(cls, value, interned_values):
+        '''
+        Returns a previously interned value equal to `value` if there is one, or `value` itself
+        otherwise (interning it).
 
-                    # If the condition matches, add the new key (containing just the option_name)
-                    if not cls._MatchConditions(conditions, matrix_row.full_dict, branch=[repository.branch]):
-                        continue
+        :param object value:
+            Formatted yaml data.
 
-                    cls._CheckAmbiguousConditions(yaml_dict,
-                                                  matched_conditions,
-                                                  option_name,
-                                                  option_value,
-                                                  conditions)
+        :param dict interned_values:
+            Interned values, by their frozen (hashable) representation and by their id.
+        '''
+        # Values shared by all rows (.. seealso:: _CompileYAMLData) are already the same object
+        interned_value = interned_values.get(id(value))
+        if interned_value is value:
+            return value
 
-                    if cls._ShouldOverride(matched_conditions, option_name, conditions):
-                        yaml_dict[option_name] = option_value
-                        matched_conditions[option_name] = set(conditions)
+        key = cls._FreezeValue(value)
+        interned_value = interned_values.setdefault(key, value)
+        interned_values[id(interned_value)] = interned_value
+        return interned_value
 
-            # Set surviving options in job.
-            for option_name, option_value in jd_formatted_data.items():
-                setattr(jobs_done_job, option_name, option_value)
 
-            # Do not create a job if exclude=='yes'
-            if jd_formatted_data.get('exclude', 'no') == 'yes':
+    @classmethod
+    def _FreezeValue(cls, value):
+        '''
+        :return object:
+            A hashable representation of yaml data: equal data have equal representations.
+        '''
+        if isinstance(value, list):
+            return (list, tuple(cls._FreezeValue(v) for v in value))
+        elif isinstance(value, dict):
+            return (dict, frozenset((k, cls._FreezeValue(v)) for k, v in value.items()))
+        else:
+            return (type(value), value)
+
+
+    @classmethod
+    def _ResolveConditions(cls, yaml_dict, facts):
+        '''
+        Replaces keys with conditions ("condition:option") in a dict by the option name, if the
+        conditions match the given facts, or removes them otherwise.
+
+        :param dict yaml_dict:
+            Dict changed in place. Sub-dicts are not changed.
+
+        :param dict(unicode,list(unicode)) facts:
+            .. seealso:: _MatchCompiledConditions
+        '''
+        matched_conditions = {}
+        for key, option_value in list(yaml_dict.items()):
+            if ':' not in key:
                 continue
 
-            # Do not create a job if there is no match for this branch
-            branch_patterns = jobs_done_job.branch_patterns or ['.*']
-            if not any([re.match(pattern, repository.branch) for pattern in branch_patterns]):
+            conditions, compiled_conditions, option_name = cls._ParseConditionalKey(key)
+
+            # Remove the key with condition text
+            del yaml_dict[key]
+
+            # If the condition matches, add the new key (containing just the option_name)
+            if not cls._MatchCompiledConditions(compiled_conditions, facts):
                 continue
 
-            jobs_done_jobs.append(jobs_done_job)
+            cls._CheckAmbiguousConditions(yaml_dict,
+                                          matched_conditions,
+                                          option_name,
+                                          option_value,
+                                          conditions)
+
+            if cls._ShouldOverride(matched_conditions, option_name, conditions):
+                yaml_dict[option_name] = option_value
+                matched_conditions[option_name] = set(conditions)
+
+
+    @classmethod
+    def _IsBranchExcluded(cls, jd_data, repository):
+        '''
+        Checks if the top-level `branch_patterns` do not match the repository branch, in which case
+        no jobs are created at all.
+
+        :param dict jd_data:
+            Data loaded from a jobs_done file (not validated yet).
+
+        :param Repository repository:
+            .. seealso:: CreateFromYAML
+
+        :return boolean:
+            True only if `branch_patterns` is not conditional and does not depend on the matrix (only
+            on "branch" and "name"), and none of the patterns match the branch.
+        '''
+        if not isinstance(jd_data, dict):
+            return False
+
+        branch_patterns = jd_data.get('branch_patterns')
+        if not isinstance(branch_patterns, list) or not all(isinstance(p, str) for p in branch_patterns):
+            return False
 
-        return jobs_done_jobs
+        if any(key.rsplit(':', 1)[-1] == 'branch_patterns' for key in jd_data if ':' in key):
+            return False  # Conditional patterns override the top-level ones for some matrix rows
+
+        format_dict = {
+            'branch':repository.branch,
+            'name':repository.name
+        }
+        try:
+            branch_patterns = [pattern.format_map(format_dict) for pattern in branch_patterns]
+        except (KeyError, IndexError, ValueError):
+            return False  # Depends on matrix variables (or is invalid, which is reported later)
+
+        return not cls._ShouldCreateJob({'branch_patterns': branch_patterns}, repository.branch)
 
 
     @classmethod
-    def _GetFormattedYAMLData(cls, yaml_data, format_dict):
+    def _ShouldCreateJob(cls, jd_formatted_data, branch):
+        '''
+        :param dict jd_formatted_data:
+            Options of a matrix row, with conditions already resolved.
+
+        :param unicode branch:
+            Repository branch for which jobs are being created.
+
+        :return boolean:
+            False if the job is excluded or there is no match for this branch in `branch_patterns`.
+        '''
+        import re
+
+        if jd_formatted_data.get('exclude', 'no') == 'yes':
+            return False
+
+        branch_patterns = jd_formatted_data.get('branch_patterns') or ['.*']
+        return any([re.match(pattern, branch) for pattern in branch_patterns])
+
+
+    @classmethod
+    def _CompileYAMLData(cls, yaml_data):
+        '''
+        Compiles yaml data into a template, which formats all keys and strings in the data with the
+        values of a matrix row (`str.format`).
+
+        Only strings with replacement fields ("{...}") are formatted for each row: all other data is
+        shared by the rows, except for dicts with conditional keys ("condition:option"), which are
+        changed in place for each row and so are always created again (along with their parents).
+
+        :param object yaml_data:
+            Data loaded from a jobs_done file.
+
+        :return tuple(bool,object):
+            (True, yaml_data) if the data does not change for each row, otherwise (False, callable),
+            where callable(format_dict) returns the formatted data.
+        '''
         if isinstance(yaml_data, str):
-            return yaml_data.format(**format_dict)
+            if '{' not in yaml_data and '}' not in yaml_data:
+                return True, yaml_data
+            return False, yaml_data.format_map
+
         elif isinstance(yaml_data, list):
-            return [cls._GetFormattedYAMLData(d, format_dict) for d in yaml_data]
+            items = [cls._CompileYAMLData(d) for d in yaml_data]
+            if all(constant for constant, _item in items):
+                return True, yaml_data
+
+            def _FormatList(format_dict):
+                return [item if constant else item(format_dict) for constant, item in items]
+            return False, _FormatList
+
         elif isinstance(yaml_data, dict):
-            return {k.format(**format_dict): cls._GetFormattedYAMLData(v, format_dict)
-                    for k, v
-                    in yaml_data.items()}
+            items = [
+                (cls._CompileYAMLData(k), cls._CompileYAMLData(v))
+                for k, v
+                in yaml_data.items()
+            ]
+            if all(key_constant and value_constant and ':' not in key
+                   for (key_constant, key), (value_constant, _value) in items):
+                return True, yaml_data
+
+            def _FormatDict(format_dict):
+                result = {}
+                for (key_constant, key), (value_constant, value) in items:
+                    result[key if key_constant else key(format_dict)] = \
+                        value if value_constant else value(format_dict)
+                return result
+            return False, _FormatDict
+
         else:
             raise ValueError('Invalid yaml data type: {}'.format(yaml_data.__class__))
 
@@ -494,19 +761,140 @@ class JobsDoneJob(object):
         :return boolean:
             Returns True if all the given conditions matches the given facts.
         '''
-        import re
         # Assemble facts
         facts = {}
         for fact_dict in fact_dicts:
             facts.update(fact_dict)
         facts.update(extra_facts)
 
-        def _Match(condition):
-            variable_name, match_mask = condition.split('-', 1)
-            fact_values = facts[variable_name]
-            return fact_values is cls._MATCH_ANY or any(re.match(match_mask, fact) for fact in fact_values)
+        compiled_conditions = [_CompileCondition(condition) for condition in conditions]
+        return cls._MatchCompiledConditions(compiled_conditions, facts)
+
+
+    @classmethod
+    def _MatchCompiledConditions(cls, compiled_conditions, facts):
+        '''
+        Same as `_MatchConditions`, for conditions already compiled and facts already assembled.
+
+        :param list(JobsDoneJob._Condition) compiled_conditions:
+            .. seealso:: _ParseConditionalKey
+
+        :param dict(unicode,list(unicode)) facts:
+            Dictionary of facts, in the form {name:list(value)} or {name:cls._MATCH_ANY}
+
+        :return boolean:
+            Returns True if all the given conditions matches the given facts.
+        '''
+        for condition in compiled_conditions:
+            if not condition.Match(facts):
+                return False
+        return True
+
+
+    @classmethod
+    def _GetMatrixValues(cls, matrix_dict):
+        '''
+        :param dict(unicode:tuple) matrix_dict:
+            A dictionary mapping names to values.
+
+        :return dict(unicode,list(list(unicode))):
+            Maps each variable name to its possible values, each value given as a list of aliases
+            (as in `_MatrixRow.full_dict`).
+        '''
+        return {name: [value.split(',') for value in values] for name, values in matrix_dict.items()}
+
+
+    @classmethod
+    def _IsMatchable(cls, compiled_conditions, variables_values):
+        '''
+        Checks if there is any combination of values that matches all the given conditions.
+
+        Each condition constrains a single variable, so it is enough to find, for each variable,
+        one value matching all conditions on that variable.
+
+        :param list(JobsDoneJob._Condition) compiled_conditions:
+            .. seealso:: _ParseConditionalKey
+
+        :param dict(unicode,list(list(unicode))) variables_values:
+            .. seealso:: _GetMatrixValues
+            Variables can also be mapped to cls._MATCH_ANY.
+
+        :return boolean:
+        '''
+        conditions_by_variable = {}
+        for condition in compiled_conditions:
+            conditions_by_variable.setdefault(condition.variable_name, []).append(condition)
 
-        return all(map(_Match, conditions))
+        for variable_name, conditions in conditions_by_variable.items():
+            values = variables_values[variable_name]
+            if values is cls._MATCH_ANY:
+                continue
+            for aliases in values:
+                if all(condition.MatchValues(aliases) for condition in conditions):
+                    break
+            else:
+                return False
+        return True
+
+
+    @classmethod
+    def _ParseConditionalKey(cls, key):
+        '''
+        Parses an option key with conditions, such as 'planet-earth:branch-master:junit_patterns'.
+
+        :param unicode key:
+
+        :return tuple(list(unicode),list(JobsDoneJob._Condition),unicode):
+            The conditions (e.g. ['planet-earth', 'branch-master']), the same conditions compiled,
+            and the option name (e.g. 'junit_patterns').
+        '''
+        conditions, compiled_conditions, option_name = _ParseConditionalKey(key)
+        return list(conditions), compiled_conditions, option_name
+
+
+    class _Condition(object):
+        '''
+        A condition in the form 'name-value', compiled to be matched against facts.
+
+        :ivar unicode variable_name:
+            Name of the fact checked by this condition (e.g. 'planet').
+
+        :ivar unicode match_mask:
+            Regex matched against the values of the fact (e.g. 'earth').
+        '''
+
+        def __init__(self, condition):
+            import re
+            self.variable_name, self.match_mask = condition.split('-', 1)
+            self._match = re.compile(self.match_mask).match
+
+
+        def Match(self, facts):
+            '''
+            :param dict(unicode,list(unicode)) facts:
+                .. seealso:: JobsDoneJob._MatchCompiledConditions
+
+            :return boolean:
+                True if any value of this condition's variable matches it.
+            '''
+            return self.MatchValues(facts[self.variable_name])
+
+
+        def MatchValues(self, fact_values):
+            '''
+            :param list(unicode) fact_values:
+                Values (aliases) of this condition's variable, or JobsDoneJob._MATCH_ANY.
+
+            :return boolean:
+                True if any of the values matches this condition.
+            '''
+            if fact_values is JobsDoneJob._MATCH_ANY:
+                return True
+            match = self._match
+            for fact in fact_values:
+                if match(fact):
+                    return True
+            return False
 
 
     class _MatrixRow(object):
@@ -547,12 +935,20 @@ class JobsDoneJob(object):
             :param dict(unicode:tuple) matrix_dict:
                 A dictionary mapping names to values.
             '''
+            return list(self.IterFromDict(matrix_dict))
+
+
+        @classmethod
+        def IterFromDict(self, matrix_dict):
+            '''
+            Same as `CreateFromDict`, yielding matrix_rows one at a time.
+            '''
             import itertools as it
 
             # Create all combinations of values available in the matrix
             names = list(matrix_dict.keys())
-            value_combinations = it.product(*list(matrix_dict.values()))
-            return [JobsDoneJob._MatrixRow(names, v) for v in value_combinations]
+            for values in it.product(*list(matrix_dict.values())):
+                yield JobsDoneJob._MatrixRow(names, values)
 
 
     @classmethod
@@ -656,6 +1052,84 @@ class UnmatchableConditionError(ValueError):
         )
 
 
+#===================================================================================================
+# LoadYAML
+#===================================================================================================
+# Use libyaml's loader when available, which is much faster than the pure-python one. Both load all
+# values as strings.
+_YAMLLoader = getattr(yaml, 'CBaseLoader', yaml.loader.BaseLoader)
+
+# Maximum number of parsed jobs_done files kept in cache by `LoadYAML`
+LOAD_YAML_CACHE_SIZE = 64
+
+_load_yaml_cache = None
+
+def LoadYAML(yaml_contents):
+    '''
+    Loads the contents of a jobs_done file, keeping all values as strings.
+
+    Parsed contents are cached by their hash, so the returned data is shared by all callers loading
+    the same contents and must not be changed.
+
+    :param unicode yaml_contents:
+        Contents of a jobs_done file, in YAML format.
+
+    :return object:
+        The loaded data (usually a dict).
+    '''
+    global _load_yaml_cache
+    import hashlib
+    from jobs_done10.common import LruCache
+
+    # Avoid errors with tabs at the end of file
+    yaml_contents = yaml_contents.strip()
+
+    if _load_yaml_cache is None:
+        _load_yaml_cache = LruCache(max_size=LOAD_YAML_CACHE_SIZE)
+    key = hashlib.sha1(yaml_contents.encode('utf-8')).hexdigest()
+    data = _load_yaml_cache.Get(key, _NOT_CACHED)
+    if data is _NOT_CACHED:
+        data = yaml.load(yaml_contents, Loader=_YAMLLoader)
+        _load_yaml_cache.Set(key, data)
+    return data
+
+
+_NOT_CACHED = object()
+
+
+
+#===================================================================================================
+# _CompileCondition
+#===================================================================================================
+@functools.lru_cache(maxsize=4096)
+def _CompileCondition(condition):
+    '''
+    :param unicode condition:
+        A condition in the form 'name-value'.
+
+    :rtype: JobsDoneJob._Condition
+    '''
+    return JobsDoneJob._Condition(condition)
+
+
+
+#===================================================================================================
+# _ParseConditionalKey
+#===================================================================================================
+@functools.lru_cache(maxsize=4096)
+def _ParseConditionalKey(key):
+    '''
+    Cached implementation of `JobsDoneJob._ParseConditionalKey`: the same keys are found in every
+    matrix row.
+
+    :rtype: tuple(tuple(unicode),tuple(JobsDoneJob._Condition),unicode)
+    '''
+    parts = key.split(':')
+    conditions = tuple(parts[:-1])
+    return conditions, tuple(_CompileCondition(c) for c in conditions), parts[-1]
+
+
+
 _TRUE_VALUES = ['TRUE', 'YES', '1']
 _FALSE_VALUES = ['FALSE', 'NO', '0']
 _TRUE_FALSE_VALUES = _TRUE_VALUES + _FALSE_VALUES
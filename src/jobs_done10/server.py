@@ -1,6 +1,11 @@
+import collections
+import functools
 import os
 import pprint
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 
 import flask
 import requests
@@ -16,8 +21,11 @@ app = flask.Flask('jobs_done')
 @app.route('/', methods=['POST'])
 def index():
     """
-    End point
-    :return:
+    End point which receives push events from Stash.
+
+    Events are only validated here and then queued, returning 202 right away: they are processed
+    in background by a pool of workers (see `start_workers`). The result of each delivery can be
+    obtained later from the `delivery_status` end point.
     """
     from dotenv import load_dotenv
 
@@ -25,29 +33,25 @@ def index():
 
     data = flask.request.json
     try:
-        return process_jobs_done(data)
+        if data is None:
+            # return a 200 response when no JSON data is posted; this is useful because
+            # the "Test Connection" in Stash does just that, making it easy to verify we have
+            # the correct version up.
+            import pkg_resources
+
+            version = pkg_resources.get_distribution('jobs_done10').version
+            return app.response_class(
+                response=f'jobs_done10 version {version}',
+                status=200,
+                mimetype='text/plain'
+            )
+
+        validate_data(data)
+        app.logger.info(f'Received request:\n{pprint.pformat(data)}')
+        delivery_id = get_delivery_queue().put(data, keys=get_coalescing_keys(data))
+        start_workers()
     except Exception:
-        error_traceback = traceback.format_exc()
-        lines = [
-            f'ERROR processing request: {flask.request}',
-            '',
-            'JSON data:',
-            '',
-            pprint.pformat(data),
-            '',
-            '',
-            error_traceback,
-            '',
-        ]
-        try:
-            recipient = send_email_with_error(data, error_traceback)
-        except Exception:
-            lines.append('*' * 80)
-            lines.append('ERROR SENDING EMAIL:')
-            lines.append(traceback.format_exc())
-        else:
-            lines.append(f'Email sent to {recipient}')
-        message = '\n'.join(lines)
+        message = handle_error(f'ERROR processing request: {flask.request}', data, traceback.format_exc())
         app.logger.exception('Uncaught exception')
         return app.response_class(
             response=message,
@@ -55,9 +59,231 @@ def index():
             mimetype='text/plain'
         )
 
+    _new_delivery.set()
+    status_url = flask.url_for('delivery_status', delivery_id=delivery_id)
+    response = app.response_class(
+        response=f'Delivery {delivery_id} queued, status available at {status_url}',
+        status=202,
+        mimetype='text/plain'
+    )
+    response.headers['Location'] = status_url
+    return response
+
+
+@app.route('/deliveries/<int:delivery_id>', methods=['GET'])
+def delivery_status(delivery_id):
+    """
+    Reports the status of a delivery received by `index` as JSON. The status is one of
+    "queued", "running", "done" or "failed".
+
+    Results contain the jobs changed, error tracebacks and who was notified about them, so they
+    are only reported (as "result", the same text previously returned by `index`) to requests
+    authorized with the token configured in JD_DELIVERIES_TOKEN, in a "Authorization: Bearer"
+    header.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv(dotenv_path=os.environ.get('JOBSDONE_DOTENV'))
+
+    status = get_delivery_queue().get(delivery_id)
+    if status is None:
+        flask.abort(404)
+    if not is_authorized_for_delivery_results():
+        del status['result']
+    return flask.jsonify(status)
+
+
+def is_authorized_for_delivery_results() -> bool:
+    """
+    Returns True if the current request has the token which gives access to delivery results.
+    """
+    import hmac
+
+    token = os.environ.get('JD_DELIVERIES_TOKEN')
+    if not token:
+        return False
+    authorization = flask.request.headers.get('Authorization', '')
+    return hmac.compare_digest(authorization.encode('utf-8'), f'Bearer {token}'.encode('utf-8'))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Reports counters collected by this server process as JSON (for instance, cache hits and misses).
+    """
+    with _metrics_lock:
+        return flask.jsonify(dict(_metrics))
+
+
+_metrics = collections.Counter()
+_metrics_lock = threading.Lock()
+
+
+def count_metric(name: str, value: int = 1) -> None:
+    """
+    Increments a counter reported by the `metrics` end point.
+    """
+    with _metrics_lock:
+        _metrics[name] += value
+
+
+def handle_error(header: str, data, error_traceback: str) -> str:
+    """
+    Sends an email about an error to the author of the push, returning the full error message.
+    """
+    lines = [
+        header,
+        '',
+        'JSON data:',
+        '',
+        pprint.pformat(data),
+        '',
+        '',
+        error_traceback,
+        '',
+    ]
+    try:
+        recipient = send_email_with_error(data, error_traceback)
+    except Exception:
+        lines.append('*' * 80)
+        lines.append('ERROR SENDING EMAIL:')
+        lines.append(traceback.format_exc())
+    else:
+        lines.append(f'Email sent to {recipient}')
+    return '\n'.join(lines)
+
+
+def validate_data(data) -> None:
+    """
+    Raises an error if the data posted to `index` is not an event we know how to process.
+    """
+    if not isinstance(data, dict) or 'eventKey' not in data:
+        raise RuntimeError(f'Invalid request json data: {pprint.pformat(data)}')
+
+
+def get_coalescing_keys(data: dict) -> List[str]:
+    """
+    Returns the keys which identify each branch changed by a push event.
+
+    When many pushes to the same branch are queued, only the latest one (which contains the
+    up-to-date .jobs_done.yaml file) needs to be processed: changes superseded by a newer delivery
+    are skipped.
+    """
+    project_key = data['repository']['project']['key']
+    slug = data['repository']['slug']
+    return [get_coalescing_key(project_key, slug, change) for change in data['changes']]
+
+
+def get_coalescing_key(project_key: str, slug: str, change: dict) -> str:
+    return f"{project_key}/{slug}/{change['ref']['id']}"
+
+
+def get_delivery_queue():
+    """
+    Returns the queue of deliveries, stored in JD_QUEUE_FILE (defaults to a file in the temp
+    directory). All gunicorn workers share the same queue.
+
+    :rtype: jobs_done10.server_queue.DeliveryQueue
+    """
+    filename = os.environ.get('JD_QUEUE_FILE')
+    if not filename:
+        import tempfile
+
+        filename = os.path.join(tempfile.gettempdir(), 'jobs_done_queue.sqlite')
+    return _get_delivery_queue_for_file(filename)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_delivery_queue_for_file(filename):
+    from jobs_done10.server_queue import DeliveryQueue
+
+    return DeliveryQueue(filename)
+
+
+# Seconds between checks for deliveries queued by other processes.
+WORKERS_POLL_INTERVAL = 1.0
+
+_workers = []
+_workers_lock = threading.Lock()
+_new_delivery = threading.Event()
+
+
+def start_workers() -> None:
+    """
+    Starts the background threads which process queued deliveries, if not started yet.
+
+    The number of threads is configured by JD_WORKERS (defaults to 2); 0 disables them, in which
+    case deliveries are only processed by calling `process_pending_deliveries`.
+
+    Called when gunicorn starts each worker process (see `server_gunicorn_config`), and also when
+    a push is received, for servers started otherwise.
+    """
+    with _workers_lock:
+        if _workers:
+            return
+        for i in range(int(os.environ.get('JD_WORKERS', '2'))):
+            worker = threading.Thread(target=_worker_loop, name=f'jobs_done-worker-{i}', daemon=True)
+            worker.start()
+            _workers.append(worker)
+
+
+def _worker_loop() -> None:
+    while True:
+        try:
+            processed = process_next_delivery()
+        except Exception:
+            app.logger.exception('Error taking a delivery from the queue')
+            processed = False
+        if not processed:
+            _new_delivery.wait(WORKERS_POLL_INTERVAL)
+            _new_delivery.clear()
+
+
+def process_pending_deliveries() -> None:
+    """
+    Processes queued deliveries until the queue is empty.
+    """
+    while process_next_delivery():
+        pass
+
+
+def process_next_delivery() -> bool:
+    """
+    Processes the next queued delivery, storing its result in the queue.
+
+    Returns False if there was nothing to process.
+    """
+    queue = get_delivery_queue()
+    delivery = queue.take()
+    if delivery is None:
+        return False
 
-def process_jobs_done(data) -> flask.Response:
+    delivery_id, data = delivery
+    try:
+        message = process_jobs_done(data, delivery_id=delivery_id)
+    except Exception:
+        message = handle_error(f'ERROR processing delivery {delivery_id}', data, traceback.format_exc())
+        app.logger.error(message)
+        queue.finish(delivery_id, queue.FAILED, message)
+    else:
+        app.logger.info(f'Delivery {delivery_id} processed:\n{message}')
+        queue.finish(delivery_id, queue.DONE, message)
+    # Deliveries to the same branches might have been waiting for this one
+    _new_delivery.set()
+    return True
+
+
+def process_jobs_done(data: dict, delivery_id: Optional[int] = None) -> str:
     """
+    Processes a push event, returning a message describing the jobs which were created, updated
+    or deleted.
+
+    If `delivery_id` is given, changes to branches which were pushed again by a newer delivery in
+    the queue are skipped.
+
+    Changes are processed concurrently by up to JD_CHANGE_WORKERS threads (defaults to 4). If any
+    of them fails, `ChangesProcessingError` is raised after all changes are processed, describing
+    the results of the other changes along with the errors.
 
     Example of a post event for a push:
 
@@ -72,23 +298,7 @@ def process_jobs_done(data) -> flask.Response:
          "refId": "refs/heads/stable-pwda11-master", "fromHash": "cd39f701ae0a729b73c57b7848fbd1f340a36514",
          "toHash": "8522b06a7c330008814a522d0342be9a997a1460", "type": "UPDATE"}]}
     """
-    if data is None:
-        # return a 200 response when no JSON data is posted; this is useful because
-        # the "Test Connection" in Stash does just that, making it easy to verify we have
-        # the correct version up.
-        import pkg_resources
-
-        version = pkg_resources.get_distribution('jobs_done10').version
-        return app.response_class(
-            response=f'jobs_done10 version {version}',
-            status=200,
-            mimetype='text/plain'
-        )
-
-    if not isinstance(data, dict) or 'eventKey' not in data:
-        raise RuntimeError(f'Invalid request json data: {pprint.pformat(data)}')
-
-    app.logger.info(f'Received request:\n{pprint.pformat(data)}')
+    validate_data(data)
 
     stash_url = os.environ['JD_STASH_URL'].rstrip()
     stash_username = os.environ['JD_STASH_USERNAME']
@@ -96,11 +306,29 @@ def process_jobs_done(data) -> flask.Response:
     project_key = data['repository']['project']['key']
     slug = data['repository']['slug']
 
-    all_new_jobs = []
-    all_updated_jobs = []
-    all_deleted_jobs = []
-    lines = []
-    for change in data['changes']:
+    def get_superseding_delivery(change):
+        if delivery_id is None:
+            return None
+        key = get_coalescing_key(project_key, slug, change)
+        latest_delivery_id = get_delivery_queue().get_latest_delivery(key)
+        if latest_delivery_id is not None and latest_delivery_id > delivery_id:
+            return latest_delivery_id
+        return None
+
+    def skip_superseded(change, result):
+        superseding_delivery_id = get_superseding_delivery(change)
+        if superseding_delivery_id is not None:
+            branch = change['ref']['id'].replace('refs/heads/', '')
+            result.lines.append(
+                f"SKIPPED - {branch} @ {change['toHash'][:7]}: superseded by delivery {superseding_delivery_id}")
+            return True
+        return False
+
+    def process_change(change):
+        result = _ChangeResult()
+        if skip_superseded(change, result):
+            return result
+
         try:
             jobs_done_file_contents = get_file_contents(
                 stash_url=stash_url,
@@ -123,36 +351,114 @@ def process_jobs_done(data) -> flask.Response:
         branch = change['ref']['id']
         prefix = 'refs/heads/'
         if not branch.startswith(prefix):
-            lines.append(f'WARNING: ignoring branch {branch}: expected {prefix}')
-            continue
+            result.lines.append(f'WARNING: ignoring branch {branch}: expected {prefix}')
+            return result
         branch = branch[len(prefix):]
         repository = Repository(url=clone_url, branch=branch)
         jenkins_url = os.environ['JD_JENKINS_URL'].rstrip('/')
         jenkins_username = os.environ['JD_JENKINS_USERNAME']
         jenkins_password = os.environ['JD_JENKINS_PASSWORD']
 
-        new_jobs, updated_jobs, deleted_jobs = jenkins.UploadJobsFromFile(
+        # Check again, a newer push might have arrived in the meantime
+        if skip_superseded(change, result):
+            return result
+
+        result.new_jobs, result.updated_jobs, result.deleted_jobs, result.unchanged_jobs = jenkins.UploadJobsFromFile(
             repository=repository,
             jobs_done_file_contents=jobs_done_file_contents,
             url=jenkins_url,
             username=jenkins_username,
             password=jenkins_password,
+            jobs_index=get_jobs_index(),
         )
-        all_new_jobs.extend(new_jobs)
-        all_updated_jobs.extend(updated_jobs)
-        all_deleted_jobs.extend(deleted_jobs)
+        return result
+
+    # Changes (usually different branches) are independent, so they are processed concurrently;
+    # results are still reported in the order of the changes
+    changes = data['changes']
+    max_workers = max(1, min(len(changes), int(os.environ.get('JD_CHANGE_WORKERS', '4'))))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(process_change, change) for change in changes]
+
+    results = []
+    errors = []
+    for change, future in zip(changes, futures):
+        try:
+            results.append(future.result())
+        except Exception:
+            errors.append(f"{change['ref']['id']} @ {change['toHash']}:\n{traceback.format_exc()}")
 
-    lines.extend(f'NEW - {x}' for x in all_new_jobs)
-    lines.extend(f'UPD - {x}' for x in all_updated_jobs)
-    lines.extend(f'DEL - {x}' for x in all_deleted_jobs)
+    lines = []
+    for result in results:
+        lines.extend(result.lines)
+    lines.extend(f'NEW - {x}' for result in results for x in result.new_jobs)
+    lines.extend(f'UPD - {x}' for result in results for x in result.updated_jobs)
+    lines.extend(f'DEL - {x}' for result in results for x in result.deleted_jobs)
+    lines.extend(f'UNC - {x}' for result in results for x in result.unchanged_jobs)
+
+    if errors:
+        raise ChangesProcessingError(lines, errors)
 
     message = '\n'.join(lines)
     app.logger.info(message)
-    return app.response_class(
-        response=message,
-        status=200,
-        mimetype='text/plain'
-    )
+    return message
+
+
+class _ChangeResult:
+    """
+    Result of processing a single change of a push event.
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.new_jobs: List[str] = []
+        self.updated_jobs: List[str] = []
+        self.deleted_jobs: List[str] = []
+        self.unchanged_jobs: List[str] = []
+
+
+class ChangesProcessingError(RuntimeError):
+    """
+    Raised by `process_jobs_done` when processing some of the changes of a push event fails; the
+    message contains the results of the other changes, followed by the errors of each failed change.
+    """
+
+    def __init__(self, lines: List[str], errors: List[str]) -> None:
+        self.lines = lines
+        self.errors = errors
+        message = '\n'.join([f'Errors processing {len(errors)} change(s)'] + lines + [''] + errors)
+        super().__init__(message)
+
+
+def get_stash_session(stash_url: str, username: str, password: str) -> requests.Session:
+    """
+    Returns a session used to make requests to Stash.
+
+    Sessions keep their connections alive, so they are shared by all requests (and threads) in the same
+    process, one for each Stash URL and credentials. JD_STASH_POOL_SIZE configures the maximum number of
+    connections kept open by each session (defaults to 10).
+    """
+    return _get_stash_session(stash_url, username, password, int(os.environ.get('JD_STASH_POOL_SIZE', '10')))
+
+
+@functools.lru_cache(maxsize=None)
+def _get_stash_session(stash_url: str, username: str, password: str, pool_size: int) -> requests.Session:
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.auth = (username, password)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_stash_timeout() -> float:
+    """
+    Returns the timeout (in seconds) for requests made to Stash, configured by JD_STASH_TIMEOUT
+    (defaults to 30).
+    """
+    return float(os.environ.get('JD_STASH_TIMEOUT', '30'))
 
 
 def get_file_contents(*, stash_url: str, username: str, password: str, project_key: str, slug: str, path: str,
@@ -160,10 +466,47 @@ def get_file_contents(*, stash_url: str, username: str, password: str, project_k
     """
     Get the file contents from the stash server.
 
+    `ref` is usually a commit hash, whose contents never change: files are cached in memory by
+    repository, path and ref (and also in JD_CACHE_FILE, if configured).
+    """
+    key = f'file:{stash_url}/{project_key}/{slug}/{path}@{ref}'
+    cache = _get_file_contents_cache()
+    contents = cache.Get(key)
+    if contents is not None:
+        count_metric('file_contents_cache_hits')
+        return contents
+
+    disk_cache = get_disk_cache()
+    contents = disk_cache.get(key) if disk_cache is not None else None
+    if contents is not None:
+        count_metric('file_contents_disk_cache_hits')
+    else:
+        count_metric('file_contents_cache_misses')
+        contents = fetch_file_contents(stash_url=stash_url, username=username, password=password,
+                                       project_key=project_key, slug=slug, path=path, ref=ref)
+        if disk_cache is not None:
+            disk_cache.set(key, contents)
+    cache.Set(key, contents)
+    return contents
+
+
+@functools.lru_cache(maxsize=None)
+def _get_file_contents_cache():
+    from jobs_done10.common import LruCache
+
+    return LruCache(max_size=256)
+
+
+def fetch_file_contents(*, stash_url: str, username: str, password: str, project_key: str, slug: str, path: str,
+                        ref: str) -> str:
+    """
+    Fetches the file contents from the stash server.
+
     We are using a "raw" Get which returns the entire file contents as text.
     """
     file_url = stash_url + f'/projects/{project_key}/repos/{slug}/raw/{path}?at={ref}'
-    response = requests.get(file_url, auth=(username, password))
+    session = get_stash_session(stash_url, username, password)
+    response = session.get(file_url, timeout=get_stash_timeout())
 
     if response.status_code == 404:
         raise IOError('File "%s" not found. Full URL: %s' % (path, file_url))
@@ -177,7 +520,44 @@ def get_file_contents(*, stash_url: str, username: str, password: str, project_k
 
 def get_clone_url(*, stash_url: str, username: str, password: str, project_key: str, slug: str) -> str:
     """
-    Get information about the repository, returning the SSH clone url.
+    Returns the SSH clone url of the repository.
+
+    Clone urls seldom change, so they are cached in memory for JD_CLONE_URL_CACHE_TTL seconds
+    (defaults to 1 hour). If JD_CACHE_FILE is configured, they are also cached in that file, shared by
+    all gunicorn workers.
+    """
+    ttl = float(os.environ.get('JD_CLONE_URL_CACHE_TTL', '3600'))
+    key = f'clone_url:{stash_url}/{project_key}/{slug}'
+    cache = _get_clone_url_cache(ttl)
+    clone_url = cache.Get(key)
+    if clone_url is not None:
+        count_metric('clone_url_cache_hits')
+        return clone_url
+
+    disk_cache = get_disk_cache()
+    clone_url = disk_cache.get(key, ttl=ttl) if disk_cache is not None else None
+    if clone_url is not None:
+        count_metric('clone_url_disk_cache_hits')
+    else:
+        count_metric('clone_url_cache_misses')
+        clone_url = fetch_clone_url(stash_url=stash_url, username=username, password=password,
+                                    project_key=project_key, slug=slug)
+        if disk_cache is not None:
+            disk_cache.set(key, clone_url)
+    cache.Set(key, clone_url)
+    return clone_url
+
+
+@functools.lru_cache(maxsize=None)
+def _get_clone_url_cache(ttl):
+    from jobs_done10.common import LruCache
+
+    return LruCache(max_size=256, ttl=ttl)
+
+
+def fetch_clone_url(*, stash_url: str, username: str, password: str, project_key: str, slug: str) -> str:
+    """
+    Get information about the repository from Stash, returning the SSH clone url.
 
     {'forkable': True,
      'id': 2231,
@@ -201,7 +581,8 @@ def get_clone_url(*, stash_url: str, username: str, password: str, project_key:
      'statusMessage': 'Available'}
     """
     url = f'{stash_url}/rest/api/1.0/projects/{project_key}/repos/{slug}'
-    response = requests.get(url, auth=(username, password))
+    session = get_stash_session(stash_url, username, password)
+    response = session.get(url, timeout=get_stash_timeout())
     if response.status_code != 200:
         response.raise_for_status()
 
@@ -215,6 +596,64 @@ def get_clone_url(*, stash_url: str, username: str, password: str, project_key:
     raise RuntimeError(f'Could not find the ssh clone url in json response:\n{pprint.pformat(data)}')
 
 
+def get_disk_cache():
+    """
+    Returns the cache shared by all gunicorn workers, stored in JD_CACHE_FILE. Returns None if the
+    variable is not configured.
+
+    The cache keeps up to JD_CACHE_MAX_ENTRIES entries (defaults to 10000), for up to JD_CACHE_MAX_AGE
+    seconds (defaults to 7 days).
+
+    :rtype: jobs_done10.server_cache.DiskCache|None
+    """
+    filename = os.environ.get('JD_CACHE_FILE')
+    if not filename:
+        return None
+    max_entries = int(os.environ.get('JD_CACHE_MAX_ENTRIES', '10000'))
+    max_age = float(os.environ.get('JD_CACHE_MAX_AGE', str(7 * 24 * 60 * 60)))
+    return _get_disk_cache_for_file(filename, max_entries, max_age)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_disk_cache_for_file(filename, max_entries, max_age):
+    from jobs_done10.server_cache import DiskCache
+
+    return DiskCache(filename, max_entries=max_entries, max_age=max_age)
+
+
+def clear_caches() -> None:
+    """
+    Clears the in-memory caches and metrics of this process (used by tests).
+    """
+    from jobs_done10.jobs_done_job import JobsDoneJob
+
+    _get_clone_url_cache.cache_clear()
+    _get_file_contents_cache.cache_clear()
+    JobsDoneJob.ClearCache()
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def get_jobs_index():
+    """
+    Returns the index of jobs published by jobs_done, used to avoid scanning every Jenkins job on
+    each push. The index is only used if the JD_JOBS_INDEX_FILE variable is configured.
+
+    :rtype: jobs_done10.generators.jenkins.JenkinsJobsIndex|None
+    """
+    filename = os.environ.get('JD_JOBS_INDEX_FILE')
+    if not filename:
+        return None
+    return _get_jobs_index_for_file(filename)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_jobs_index_for_file(filename):
+    from jobs_done10.generators.jenkins import JenkinsJobsIndex
+
+    return JenkinsJobsIndex(filename)
+
+
 def send_email_with_error(data: dict, error_traceback: str) -> str:
     """
     Send an email to the user who committed the changes that an error has happened while processing
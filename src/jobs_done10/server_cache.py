@@ -0,0 +1,79 @@
+import sqlite3
+import time
+from typing import Optional
+
+from jobs_done10.common import SQLiteConnection
+
+
+class DiskCache:
+    """
+    Key/value cache of strings backed by a SQLite database, shared by all processes using the same
+    file (for instance, gunicorn workers).
+
+    Entries are evicted when new ones are set: the ones older than `max_age`, and the oldest ones
+    beyond `max_entries`.
+    """
+
+    def __init__(self, filename: str, *, max_entries: Optional[int] = None, max_age: Optional[float] = None) -> None:
+        """
+        :param filename: path to the SQLite database, created if it does not exist.
+        :param max_entries: if given, maximum number of entries kept in the database.
+        :param max_age: if given, entries older than this (in seconds) are deleted.
+        """
+        self.filename = filename
+        self.max_entries = max_entries
+        self.max_age = max_age
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            connection.execute('CREATE INDEX IF NOT EXISTS entries_updated ON entries (updated)')
+
+    def get(self, key: str, ttl: Optional[float] = None) -> Optional[str]:
+        """
+        Returns the value stored for the given key, or None if it is missing.
+
+        :param ttl: if given, entries older than this (in seconds) are treated as missing.
+        """
+        with self._connect() as connection:
+            row = connection.execute('SELECT value, updated FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, updated = row
+        if ttl is not None and time.time() - updated > ttl:
+            return None
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'INSERT OR REPLACE INTO entries (key, value, updated) VALUES (?, ?, ?)',
+                (key, value, now),
+            )
+            self._evict(connection, now)
+
+    def _evict(self, connection: sqlite3.Connection, now: float) -> None:
+        if self.max_age is not None:
+            connection.execute('DELETE FROM entries WHERE updated < ?', (now - self.max_age,))
+        if self.max_entries is not None:
+            connection.execute(
+                """
+                DELETE FROM entries WHERE key IN (
+                    SELECT key FROM entries ORDER BY updated DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._connect() as connection:
+            connection.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def _connect(self) -> SQLiteConnection:
+        return SQLiteConnection(self.filename)
@@ -0,0 +1,19 @@
+"""
+Gunicorn configuration for the jobs_done server, used with:
+
+    gunicorn -c python:jobs_done10.server_gunicorn_config jobs_done10.server:app
+"""
+import os
+
+
+def post_fork(server, worker) -> None:
+    """
+    Starts the threads which process queued deliveries as soon as each gunicorn worker process is
+    forked, so deliveries left in the queue (by a restart, or by other processes) are processed
+    without waiting for a new push to reach this process.
+    """
+    from dotenv import load_dotenv
+    from jobs_done10.server import start_workers
+
+    load_dotenv(dotenv_path=os.environ.get('JOBSDONE_DOTENV'))
+    start_workers()
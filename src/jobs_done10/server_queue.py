@@ -0,0 +1,170 @@
+import json
+import time
+from typing import Iterable, Optional, Tuple
+
+from jobs_done10.common import SQLiteConnection
+
+
+class DeliveryQueue:
+    """
+    Queue of webhook deliveries waiting to be processed by the server, backed by a SQLite database.
+
+    The database file can be shared by many processes (for instance, gunicorn workers): each
+    delivery is taken by a single worker, and its result is kept so it can be queried later.
+
+    Deliveries can be associated with keys (for instance, the branches they change), keeping track
+    of the latest delivery for each key: this allows workers to skip work that was superseded by a
+    newer delivery. Deliveries sharing a key are also processed one at a time, in order.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    def __init__(self, filename: str, *, stale_timeout: float = 3600, retention: float = 7 * 24 * 3600) -> None:
+        """
+        :param filename: path to the SQLite database, created if it does not exist.
+        :param stale_timeout: deliveries running for longer than this (in seconds) are assumed to
+            belong to a worker that died, and are queued again.
+        :param retention: processed deliveries are removed after this many seconds.
+        """
+        self.filename = filename
+        self.stale_timeout = stale_timeout
+        self.retention = retention
+        with self._connect() as connection:
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS deliveries (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    result TEXT,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL
+                )
+            """)
+            connection.execute('CREATE INDEX IF NOT EXISTS deliveries_status ON deliveries (status, id)')
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS latest_deliveries (
+                    key TEXT PRIMARY KEY,
+                    delivery_id INTEGER NOT NULL
+                )
+            """)
+            connection.execute("""
+                CREATE TABLE IF NOT EXISTS delivery_keys (
+                    key TEXT NOT NULL,
+                    delivery_id INTEGER NOT NULL,
+                    PRIMARY KEY (key, delivery_id)
+                )
+            """)
+            connection.execute('CREATE INDEX IF NOT EXISTS delivery_keys_delivery ON delivery_keys (delivery_id)')
+
+    def put(self, data: dict, keys: Iterable[str] = ()) -> int:
+        """
+        Adds a new delivery to the end of the queue, returning its id.
+
+        :param keys: the new delivery becomes the latest one for each of these keys, and is not
+            taken while other deliveries with any of them are queued before it or running.
+        """
+        keys = sorted(set(keys))
+        now = time.time()
+        with self._connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'DELETE FROM deliveries WHERE status IN (?, ?) AND updated < ?',
+                (self.DONE, self.FAILED, now - self.retention),
+            )
+            connection.execute('DELETE FROM latest_deliveries WHERE delivery_id NOT IN (SELECT id FROM deliveries)')
+            connection.execute('DELETE FROM delivery_keys WHERE delivery_id NOT IN (SELECT id FROM deliveries)')
+            cursor = connection.execute(
+                'INSERT INTO deliveries (status, payload, created, updated) VALUES (?, ?, ?, ?)',
+                (self.QUEUED, json.dumps(data), now, now),
+            )
+            delivery_id = cursor.lastrowid
+            # Ids always increase, so the new delivery is the latest one
+            connection.executemany(
+                'INSERT OR REPLACE INTO latest_deliveries (key, delivery_id) VALUES (?, ?)',
+                [(key, delivery_id) for key in keys],
+            )
+            connection.executemany(
+                'INSERT INTO delivery_keys (key, delivery_id) VALUES (?, ?)',
+                [(key, delivery_id) for key in keys],
+            )
+            return delivery_id
+
+    def get_latest_delivery(self, key: str) -> Optional[int]:
+        """
+        Returns the id of the latest delivery put with the given key, or None if there is none.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT delivery_id FROM latest_deliveries WHERE key = ?',
+                (key,),
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def take(self) -> Optional[Tuple[int, dict]]:
+        """
+        Takes the oldest queued delivery, marking it as running.
+
+        Deliveries sharing a key with a running delivery (or with an older queued one) are not taken,
+        so the deliveries for each key are processed one at a time, in order.
+
+        Returns a tuple (delivery id, payload), or None if there are no deliveries waiting.
+        """
+        now = time.time()
+        with self._connect() as connection:
+            # Lock the database right away, so no other worker can take the same delivery
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                """
+                SELECT id, payload FROM deliveries AS delivery
+                WHERE (status = :queued OR (status = :running AND updated < :stale))
+                AND NOT EXISTS (
+                    SELECT 1 FROM delivery_keys AS own
+                    JOIN delivery_keys AS other ON other.key = own.key AND other.delivery_id != own.delivery_id
+                    JOIN deliveries AS blocking ON blocking.id = other.delivery_id
+                    WHERE own.delivery_id = delivery.id
+                    AND (blocking.status = :running OR (blocking.status = :queued AND blocking.id < delivery.id))
+                )
+                ORDER BY id LIMIT 1
+                """,
+                dict(queued=self.QUEUED, running=self.RUNNING, stale=now - self.stale_timeout),
+            ).fetchone()
+            if row is None:
+                return None
+            delivery_id, payload = row
+            connection.execute(
+                'UPDATE deliveries SET status = ?, updated = ? WHERE id = ?',
+                (self.RUNNING, now, delivery_id),
+            )
+            return delivery_id, json.loads(payload)
+
+    def finish(self, delivery_id: int, status: str, result: str) -> None:
+        """
+        Stores the result of processing a delivery.
+
+        :param status: either DONE or FAILED.
+        """
+        assert status in (self.DONE, self.FAILED), f'Invalid status: {status}'
+        with self._connect() as connection:
+            connection.execute(
+                'UPDATE deliveries SET status = ?, result = ?, updated = ? WHERE id = ?',
+                (status, result, time.time(), delivery_id),
+            )
+
+    def get(self, delivery_id: int) -> Optional[dict]:
+        """
+        Returns the status of a delivery as a dict, or None if the delivery is unknown.
+        """
+        with self._connect() as connection:
+            row = connection.execute(
+                'SELECT id, status, result, created, updated FROM deliveries WHERE id = ?',
+                (delivery_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'status', 'result', 'created', 'updated'), row))
+
+    def _connect(self) -> SQLiteConnection:
+        return SQLiteConnection(self.filename)
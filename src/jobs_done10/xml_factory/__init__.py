@@ -1,5 +1,7 @@
 
 
-from ._pretty_xml import WritePrettyXML, WritePrettyXMLElement
+from ._fingerprint import GetXmlFingerprint
+from ._pretty_xml import (
+    GetPrettyXMLElement, IterPrettyXMLElement, WritePrettyXML, WritePrettyXMLElement)
 from ._xml_factory import XmlFactory
 
@@ -0,0 +1,58 @@
+import hashlib
+from xml.etree import ElementTree
+
+from ._pretty_xml import IterPrettyXMLElement
+
+
+#===================================================================================================
+# GetXmlFingerprint
+#===================================================================================================
+def GetXmlFingerprint(contents):
+    '''
+    Returns a fingerprint of XML contents, which ignores the xml header, comments, whitespace
+    between tags and the order of attributes. This allows comparing a job we generated with the
+    config.xml obtained from Jenkins without comparing (or even keeping) their contents.
+
+    The fingerprint of contents generated by a XmlFactory is the same as the one computed by
+    `XmlFactory.IterContents` while producing them.
+
+    :param unicode contents:
+        XML contents.
+
+    :return unicode:
+        SHA-1 (hex digest) of the canonical representation of `contents`: the pretty xml of its
+        elements, without texts made only of whitespace in elements with sub-elements.
+
+    :raises xml.etree.ElementTree.ParseError:
+        If `contents` is not valid XML.
+    '''
+    root = ElementTree.fromstring(contents)
+    for element in root.iter():
+        if len(element) > 0 and element.text is not None and not element.text.strip():
+            element.text = None
+        element.tail = None
+    return GetFingerprint(IterPrettyXMLElement(root))
+
+
+
+def GetFingerprint(chunks):
+    '''
+    :param iter(unicode) chunks:
+        Canonical XML contents, in chunks.
+
+    :return unicode:
+        The fingerprint of the given contents.
+    '''
+    fingerprint = NewFingerprint()
+    for chunk in chunks:
+        fingerprint.update(chunk.encode('utf-8'))
+    return fingerprint.hexdigest()
+
+
+
+def NewFingerprint():
+    '''
+    :return:
+        A hashlib object to compute a fingerprint incrementally.
+    '''
+    return hashlib.sha1()
@@ -1,5 +1,6 @@
 
 
+import sys
 from xml.etree import ElementTree
 
 
@@ -38,7 +39,7 @@ def WritePrettyXML(input, output):
 #===================================================================================================
 def WritePrettyXMLElement(oss, element, indent=0):
     '''
-    Writes an xml element in the given file (oss) recursivelly, in pretty xml.
+    Writes an xml element in the given file (oss), in pretty xml.
 
     :param file oss:
         The output file to write
@@ -48,35 +49,145 @@ def WritePrettyXMLElement(oss, element, indent=0):
 
     :param int indent:
         The level of indentation to write the tag.
-        This is used internally for pretty printing.
     '''
-    from xml.sax.saxutils import escape
+    for chunk in IterPrettyXMLElement(element, indent):
+        oss.write(chunk)
 
-    INDENT = '  '
 
-    # Start tag
-    oss.write(INDENT * indent + '<%s' % element.tag)
-    for i_name, i_value in sorted(element.attrib.items()):
-        oss.write(' %s="%s"' % (i_name, escape(i_value)))
 
-    if len(element) == 0 and element.text is None:
-        oss.write('/>')
-        return
+#===================================================================================================
+# GetPrettyXMLElement
+#===================================================================================================
+def GetPrettyXMLElement(element, indent=0):
+    '''
+    Returns an xml element in pretty xml.
+
+    Same as WritePrettyXMLElement, but building a single string.
+
+    :param Element element:
+        The Element instance (ElementTree)
 
-    oss.write('>')
+    :param int indent:
+        The level of indentation to write the tag.
 
-    # Sub-elements
-    for i_element in element:
-        oss.write('\n')
-        WritePrettyXMLElement(oss, i_element, indent + 1)
+    :rtype: unicode
+    '''
+    fragments, = _IterPrettyXMLFragments(element, indent)
+    return ''.join(fragments)
 
-    # Text
-    if element.text is not None:
-        # "&#xd;" is the hexadecimal xml entity for "\r".
-        oss.write(escape(element.text, {'\r': '&#xd;'}))
 
-    # End tag
-    if element.text is None:
-        oss.write('\n' + INDENT * indent)
-    oss.write('</%s>' % element.tag)
 
+#===================================================================================================
+# IterPrettyXMLElement
+#===================================================================================================
+def IterPrettyXMLElement(element, indent=0, chunk_size=None):
+    '''
+    Yields an xml element in pretty xml, in chunks, so it can be written somewhere without building
+    the complete contents in memory.
+
+    :param Element element:
+        The Element instance (ElementTree)
+
+    :param int indent:
+        The level of indentation to write the tag.
+
+    :param int|None chunk_size:
+        Approximate number of xml fragments (tags, attributes, texts) in each chunk. Defaults to
+        `_CHUNK_SIZE`.
+
+    :rtype: iter(unicode)
+    '''
+    if chunk_size is None:
+        chunk_size = _CHUNK_SIZE
+    for fragments in _IterPrettyXMLFragments(element, indent, chunk_size):
+        if fragments:
+            yield ''.join(fragments)
+
+
+_INDENT = '  '
+
+# Default number of xml fragments in each chunk produced by IterPrettyXMLElement.
+_CHUNK_SIZE = 8192
+
+# Indentation of elements after the first one, by level (grows as needed).
+_NEWLINE_INDENTS = ['\n']
+
+
+def _EscapeAttribute(value):
+    # Same as xml.sax.saxutils.escape(value)
+    return value.replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;')
+
+
+def _EscapeText(text):
+    # Same as xml.sax.saxutils.escape(text, {'\r': '&#xd;'}) ("&#xd;" is the hexadecimal xml
+    # entity for "\r").
+    return text.replace('&', '&amp;').replace('>', '&gt;').replace('<', '&lt;').replace('\r', '&#xd;')
+
+
+def _IterPrettyXMLFragments(element, indent, chunk_size=None, non_canonical=None):
+    '''
+    Yields lists with the fragments of an element in pretty xml.
+
+    Sub-elements are handled with an explicit stack instead of recursion, so deep trees do not
+    reach the recursion limit.
+
+    :param int|None chunk_size:
+        Yields a list whenever it has this many fragments. If None, yields a single list.
+
+    :param list|None non_canonical:
+        If given, elements whose text is lost when the pretty xml is parsed again (empty texts and
+        texts of elements with sub-elements) are appended to it. .. seealso:: GetXmlFingerprint
+    '''
+    if chunk_size is None:
+        chunk_size = sys.maxsize
+    newline_indents = _NEWLINE_INDENTS
+    fragments = []
+    append = fragments.append
+
+    # Items are either (element, indentation level, prefix) or the string closing an element.
+    stack = [(element, indent, _INDENT * indent)]
+    while stack:
+        if len(fragments) >= chunk_size:
+            yield fragments
+            fragments = []
+            append = fragments.append
+
+        item = stack.pop()
+        if item.__class__ is str:
+            append(item)
+            continue
+        element, indent, prefix = item
+
+        # Start tag
+        tag = element.tag
+        append(prefix + '<' + tag)
+        attrib = element.attrib
+        if attrib:
+            for i_name, i_value in sorted(attrib.items()):
+                append(' %s="%s"' % (i_name, _EscapeAttribute(i_value)))
+
+        text = element.text
+        if text is None:
+            if len(element) == 0:
+                append('/>')
+                continue
+            # End tag, after the sub-elements
+            while len(newline_indents) <= indent:
+                newline_indents.append(newline_indents[-1] + _INDENT)
+            stack.append(newline_indents[indent] + '</' + tag + '>')
+        else:
+            if non_canonical is not None and (not text or len(element)):
+                non_canonical.append(element)
+            # Text and end tag, after the sub-elements
+            stack.append(_EscapeText(text) + '</' + tag + '>')
+        append('>')
+
+        # Sub-elements
+        if len(element):
+            indent += 1
+            while len(newline_indents) <= indent:
+                newline_indents.append(newline_indents[-1] + _INDENT)
+            child_prefix = newline_indents[indent]
+            stack.extend((i_element, indent, child_prefix) for i_element in reversed(element))
+
+    yield fragments
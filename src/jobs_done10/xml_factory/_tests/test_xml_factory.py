@@ -6,7 +6,8 @@ from xml.etree import ElementTree
 
 import pytest
 
-from jobs_done10.xml_factory import WritePrettyXML, WritePrettyXMLElement, XmlFactory
+from jobs_done10.xml_factory import (
+    GetPrettyXMLElement, GetXmlFingerprint, WritePrettyXML, WritePrettyXMLElement, XmlFactory)
 
 
 
@@ -116,6 +117,32 @@ class Test(object):
         assert factory.AsJson() == '{"elements": {"name": ["Alpha", "Bravo", "Charlie"]}, "components": {"component": [{"name": "Alpha"}, {"name": "Bravo"}, {"name": "Charlie"}]}}'
 
 
+    def testAsDict(self):
+        import json
+
+        factory = XmlFactory('root')
+        assert factory.AsDict() == {'root': None}
+        assert factory.AsJson() == '{"root": null}'
+
+        # Same tags (from the first two sub-elements): a list without empty values
+        factory['elements/name'] = 'Alpha'
+        factory['elements/name+'] = ' '
+        factory['elements/other'] = 'Ação'
+        # Different tags: the last value of each tag
+        factory['mixed/alpha'] = 'Alpha'
+        factory['mixed/bravo'] = 'Bravo'
+        factory['mixed/alpha+/charlie'] = 'Charlie'
+        factory['single/alpha'] = '"Alpha"'
+
+        expected = {
+            'elements': {'name': ['Alpha', 'Ação']},
+            'mixed': {'alpha': {'charlie': 'Charlie'}, 'bravo': 'Bravo'},
+            'single': {'alpha': '"Alpha"'},
+        }
+        assert factory.AsDict() == expected
+        assert factory.AsJson() == json.dumps(expected)
+
+
     def testHudsonJob(self):
         '''\
         <project>
@@ -183,6 +210,148 @@ class Test(object):
         )
 
 
+    def testChangedElements(self):
+        '''\
+        <root>
+          <publishers>
+            <hudson.tasks.Other>Moved</hudson.tasks.Other>
+            <hudson.tasks.Mailer>Alpha</hudson.tasks.Mailer>
+            <hudson.tasks.Mailer>Bravo</hudson.tasks.Mailer>
+            <hudson.tasks.Shell>Renamed</hudson.tasks.Shell>
+            <hudson.tasks.Renamed>Delta</hudson.tasks.Renamed>
+            <hudson.tasks.Other id="Charlie"/>
+          </publishers>
+        </root>'''
+        # Elements changed directly (not through XmlFactory) must be found in their new state
+        factory = XmlFactory('root')
+        factory['publishers/hudson.tasks.Mailer'] = 'Alpha'
+        factory['publishers/hudson.tasks.Other'] = 'Other'
+        factory['publishers/hudson.tasks.Mailer+'] = 'Bravo'
+        factory['publishers/hudson.tasks.Renamed'] = 'Renamed'
+
+        publishers = factory.root.find('publishers')
+        other = publishers.find('hudson.tasks.Other')
+        publishers.remove(other)
+        publishers.insert(0, other)
+        factory['publishers/hudson.tasks.Other'] = 'Moved'
+
+        publishers[3].tag = 'hudson.tasks.Shell'
+        factory['publishers/hudson.tasks.Renamed'] = 'Delta'
+        factory['publishers/hudson.tasks.Other+@id'] = 'Charlie'
+
+        assert (
+            factory.GetContents()
+            == dedent(self.testChangedElements.__doc__)
+        )
+
+
+    def testReplacedElements(self):
+        '''\
+        <root>
+          <hudson.tasks.Shell>Bravo</hudson.tasks.Shell>
+          <hudson.tasks.Mailer>Charlie</hudson.tasks.Mailer>
+        </root>'''
+        # Removing a child and appending another directly keeps the number of children: the new
+        # child must still be found, instead of creating a duplicate
+        factory = XmlFactory('root')
+        factory['hudson.tasks.Other'] = 'Alpha'
+        factory['hudson.tasks.Shell'] = 'Bravo'
+
+        factory.root.remove(factory.root.find('hudson.tasks.Other'))
+        ElementTree.SubElement(factory.root, 'hudson.tasks.Mailer')
+        factory['hudson.tasks.Mailer'] = 'Charlie'
+
+        assert (
+            factory.GetContents()
+            == dedent(self.testReplacedElements.__doc__)
+        )
+
+
+    def testDeepTree(self):
+        import sys
+
+        depth = sys.getrecursionlimit() + 10
+        factory = XmlFactory('root')
+        factory['/'.join(['element'] * depth)] = 'deep'
+
+        lines = factory.GetContents().splitlines()
+        assert len(lines) == 2 * depth + 1
+        assert lines[depth] == '  ' * depth + '<element>deep</element>'
+        assert lines[-2:] == ['  </element>', '</root>']
+
+
+    def testTextAndElements(self):
+        '''\
+        <root>
+          <alpha>
+            <bravo/>Alpha &amp; &lt;Bravo&gt;&#xd;</alpha>
+        </root>'''
+        factory = XmlFactory('root')
+        factory['alpha'] = 'Alpha & <Bravo>\r'
+        factory['alpha/bravo']
+
+        assert (
+            factory.GetContents()
+            == dedent(self.testTextAndElements.__doc__)
+        )
+        assert GetPrettyXMLElement(factory.root) == factory.GetContents()
+
+
+    def testWrite(self, tmpdir):
+        import gzip
+        from io import BytesIO
+
+        factory = XmlFactory('root')
+        factory['name'] = 'Ação'
+        for i in range(10000):
+            factory['elements/element+'] = i
+        expected = factory.GetContents(xml_header=True)
+
+        chunks = list(factory.IterContents(xml_header=True))
+        assert len(chunks) > 2
+        assert ''.join(chunks) == expected
+
+        oss = BytesIO()
+        with gzip.GzipFile(fileobj=oss, mode='wb') as f:
+            factory.Write(f, xml_header=True)
+        assert gzip.decompress(oss.getvalue()).decode('utf-8') == expected
+
+        filename = str(tmpdir / 'written.xml')
+        factory.Write(filename)
+        with open(filename, 'rb') as f:
+            assert f.read() == factory.GetContents().encode('utf-8')
+
+        oss = StringIO()
+        factory.Print(oss)
+        assert oss.getvalue() == factory.GetContents()
+
+
+    def testFingerprint(self):
+        factory = XmlFactory('root')
+        factory['alpha@one'] = '1'
+        factory['alpha@two'] = '2'
+        factory['bravo/charlie'] = 'Charlie'
+        fingerprint = factory.GetFingerprint()
+
+        fingerprints = []
+        contents = ''.join(factory.IterContents(xml_header=True, on_fingerprint=fingerprints.append))
+        assert fingerprints == [fingerprint]
+        assert GetXmlFingerprint(contents) == fingerprint
+
+        # Ignores whitespace between tags, comments and the order of attributes
+        assert GetXmlFingerprint(
+            '<root> <!-- comment --><alpha two="2"  one="1" />\n<bravo><charlie>Charlie</charlie></bravo></root>'
+        ) == fingerprint
+        assert GetXmlFingerprint('<root><alpha one="1" two="2"/><bravo/></root>') != fingerprint
+
+        # Texts which do not survive parsing the xml again
+        factory['bravo'] = 'Bravo'
+        factory['delta'] = ''
+        contents = factory.GetContents()
+        assert factory.GetFingerprint() == GetXmlFingerprint(contents)
+        assert factory.GetContents() == contents
+
+
     def testTypeError(self):
         with pytest.raises(TypeError):
             XmlFactory(9)
@@ -1,10 +1,38 @@
 
 
-from io import StringIO
-from itertools import chain
+import functools
 from xml.etree import ElementTree
 
-from ._pretty_xml import WritePrettyXMLElement
+from ._fingerprint import GetFingerprint, NewFingerprint
+from ._pretty_xml import (
+    _CHUNK_SIZE, GetPrettyXMLElement, IterPrettyXMLElement, WritePrettyXMLElement,
+    _IterPrettyXMLFragments)
+
+
+#===================================================================================================
+# _ParsePath
+#===================================================================================================
+@functools.lru_cache(maxsize=1024)
+def _ParsePath(name):
+    '''
+    Parses a path used to obtain elements from a XmlFactory.
+
+    :param unicode name:
+        Tags separated by slashes, each ending or not with "+".
+
+    :return tuple(tuple(unicode,bool)):
+        The tag of each part, and whether a new element must be appended for it.
+    '''
+    if name == '':
+        return ()
+    result = []
+    for i_part in name.split('/'):
+        if i_part.endswith('+'):
+            result.append((i_part[:-1], True))
+        else:
+            result.append((i_part, False))
+    return tuple(result)
+
 
 
 #===================================================================================================
@@ -39,6 +67,20 @@ class XmlFactory(object):
         else:
             raise TypeError("Unknown root_element parameter type: %s" % type(root_element))
 
+        # Index of children by tag for the elements accessed through this factory, shared with the
+        # factories returned by __getitem__ and __setitem__. See _ObtainElement.
+        self._indexes = {}
+
+
+    def _CreateFactory(self, element):
+        '''
+        Returns a XmlFactory for a sub-element, sharing our index of children.
+        '''
+        result = XmlFactory.__new__(XmlFactory)
+        result.root = element
+        result._indexes = self._indexes
+        return result
+
 
     def __setitem__(self, name, value):
         '''
@@ -65,7 +107,7 @@ class XmlFactory(object):
         else:
             result = self._ObtainElement(name)
             result.text = str(value)
-        return XmlFactory(result)
+        return self._CreateFactory(result)
 
 
     def __getitem__(self, name):
@@ -81,7 +123,7 @@ class XmlFactory(object):
         '''
         assert '@' not in name, 'The "at" (@) is used for attribute definitions'
         result = self._ObtainElement(name)
-        return XmlFactory(result)
+        return self._CreateFactory(result)
 
 
     def _ObtainElement(self, name):
@@ -93,24 +135,53 @@ class XmlFactory(object):
             If any of the parts ends with a "+" it creates a new sub-element in that part even if
             it already exists.
         '''
-        parent = self.root
-        if name == '':
-            # On Python 2.7 parent.find('') returns None instead of the parent itself
-            result = parent
-        else:
-            parts = name.split('/')
-            for i_part in parts:
-                if i_part.endswith('+'):
-                    i_part = i_part[:-1]
-                    result = ElementTree.SubElement(parent, i_part)
-                else:
-                    result = parent.find(i_part)
-                    if result is None:
-                        result = ElementTree.SubElement(parent, i_part)
-                parent = result
+        # Children are looked up in an index of the children by tag of each element, instead of a
+        # linear search with `parent.find(tag)`. Elements may also be changed directly (removed,
+        # added, moved, renamed), which the index can't always detect: it is rebuilt whenever the
+        # number of children changes or the indexed child is no longer found at its position with
+        # the same tag. Tags missing from the index are confirmed with `parent.find(tag)` before
+        # creating a new child, since they might have been added directly (for instance, removing
+        # a child and appending another keeps the number of children).
+        indexes = self._indexes
+        result = self.root
+        for tag, append in _ParsePath(name):
+            count = len(result)
+            index = indexes.get(id(result))
+            if index is None or index[1] != count:
+                index = self._IndexChildren(result)
+            if not append:
+                found = index[2].get(tag)
+                if found is not None and (result[found[0]] is not found[1] or found[1].tag != tag):
+                    index = self._IndexChildren(result)
+                    found = index[2].get(tag)
+                elif found is None and result.find(tag) is not None:
+                    index = self._IndexChildren(result)
+                    found = index[2].get(tag)
+                if found is not None:
+                    result = found[1]
+                    continue
+            child = ElementTree.SubElement(result, tag)
+            index[1] = count + 1
+            index[2].setdefault(tag, (count, child))
+            result = child
         return result
 
 
+    def _IndexChildren(self, parent):
+        '''
+        Indexes the children of the given element by tag.
+
+        :return list:
+            [parent, number of children, dict mapping each tag to the (position, element) of the
+            first child with that tag]. The parent is kept in the index so its id is not reused.
+        '''
+        children = {}
+        for position, child in enumerate(parent):
+            children.setdefault(child.tag, (position, child))
+        index = self._indexes[id(parent)] = [parent, len(parent), children]
+        return index
+
+
     def Print(self, oss=None, xml_header=False):
         '''
         Prints the resulting XML in the stdout or the given output stream.
@@ -130,67 +201,129 @@ class XmlFactory(object):
         WritePrettyXMLElement(oss, self.root)
 
 
+    def Write(self, output, xml_header=False):
+        '''
+        Writes the resulting XML encoded as UTF-8, in chunks, without building the complete
+        contents in memory.
+
+        :type output: unicode | binary file-like object
+        :param output:
+            A filename, or an object with a `write(bytes)` method (a file opened in binary mode, a
+            gzip.GzipFile, a socket file, etc).
+        '''
+        if isinstance(output, str):
+            with open(output, 'wb') as f:
+                self.Write(f, xml_header=xml_header)
+            return
+
+        for chunk in self.IterContents(xml_header=xml_header):
+            output.write(chunk.encode('utf-8'))
+
+
+    def IterContents(self, xml_header=False, on_fingerprint=None):
+        '''
+        Yields the resulting XML in chunks. Suitable, once encoded, as a streamed (chunked) HTTP
+        request body.
+
+        :param callable on_fingerprint:
+            If given, the fingerprint of the XML is computed while producing it, and passed to this
+            function after the last chunk. .. seealso:: GetXmlFingerprint
+
+        :rtype: iter(unicode)
+        '''
+        if xml_header:
+            yield '<?xml version="1.0" ?>\n'
+        if on_fingerprint is None:
+            for chunk in IterPrettyXMLElement(self.root):
+                yield chunk
+            return
+
+        fingerprint = NewFingerprint()
+        non_canonical = []
+        for fragments in _IterPrettyXMLFragments(self.root, 0, _CHUNK_SIZE, non_canonical):
+            if fragments:
+                chunk = ''.join(fragments)
+                fingerprint.update(chunk.encode('utf-8'))
+                yield chunk
+
+        if non_canonical:
+            # Some texts would be lost when parsing the XML: leave them out of the fingerprint (this
+            # requires serializing the XML again, but such texts are unusual)
+            texts = [element.text for element in non_canonical]
+            try:
+                for element in non_canonical:
+                    element.text = None
+                on_fingerprint(GetFingerprint(IterPrettyXMLElement(self.root)))
+            finally:
+                for element, text in zip(non_canonical, texts):
+                    element.text = text
+        else:
+            on_fingerprint(fingerprint.hexdigest())
+
+
+    def GetFingerprint(self):
+        '''
+        Returns the fingerprint of the resulting XML. .. seealso:: GetXmlFingerprint
+
+        :return unicode:
+        '''
+        result = []
+        for _chunk in self.IterContents(on_fingerprint=result.append):
+            pass
+        return result[0]
+
+
     def GetContents(self, xml_header=False):
         '''
         Returns the resulting XML.
 
         :return unicode:
         '''
-        oss = StringIO()
-        self.Print(oss, xml_header=xml_header)
-        return oss.getvalue()
+        contents = GetPrettyXMLElement(self.root)
+        if xml_header:
+            contents = '<?xml version="1.0" ?>\n' + contents
+        return contents
 
 
     def AsDict(self):
         '''
         Returns the data-structure as dict.
 
+        The conversion follows https://github.com/knadh/xmlutils.py/blob/master/xmlutils/xml2json.py:
+        elements without sub-elements are converted to their (stripped) text, or None; other
+        elements to a dict mapping the tags of their sub-elements to their values, or, when the
+        first two sub-elements have the same tag, to a dict mapping that tag to the list of values
+        which are not None. Attributes are ignored.
+
         :return dict:
         '''
-
-        def _elem2list(elem, return_children=False):
-            '''
-            Copied from:
-                https://github.com/knadh/xmlutils.py/blob/master/xmlutils/xml2json.py
-            '''
-            block = {}
-
-            # get the element's children
-            children = elem.getchildren()
-
-            if children:
-                cur = list(map(_elem2list, children))
-
-                # create meaningful lists
-                scalar = False
-                try:
-                    if elem[0].tag != elem[1].tag:  # [{a: 1}, {b: 2}, {c: 3}] => {a: 1, b: 2, c: 3}
-                        cur = dict(chain(*(d.items() for d in cur)))
-                    else:
-                        scalar = True
-                except Exception as e:  # [{a: 1}, {a: 2}, {a: 3}] => {a: [1, 2, 3]}
-                    scalar = True
-
-                if scalar:
-                    if len(cur) > 1:
-                        cur = {elem[0].tag: [list(e.values())[0] for e in cur if list(e.values())[0] is not None]}
-                    else:
-                        cur = {elem[0].tag: list(cur[0].values())[0] }
-
-                block[elem.tag] = cur
-                if return_children:
-                    return cur
+        root = self.root
+        if len(root) == 0:
+            return {root.tag: _GetTextValue(root)}
+
+        # Reversed pre-order: sub-elements are converted before their parents
+        values = {}
+        for element in reversed(list(root.iter())):
+            if len(element) == 0:
+                values[id(element)] = _GetTextValue(element)
+                continue
+
+            first = element[0]
+            if len(element) == 1:
+                value = {first.tag: values.pop(id(first))}
+            elif first.tag != element[1].tag:
+                value = {}
+                for i_element in element:
+                    value[i_element.tag] = values.pop(id(i_element))
             else:
-                val = None
-                if elem.text:
-                    val = elem.text.strip()
-                    val = val if len(val) > 0 else None
-
-                block[elem.tag] = val
-
-            return block
-
-        return _elem2list(self.root, return_children=True)
+                items = []
+                for i_element in element:
+                    i_value = values.pop(id(i_element))
+                    if i_value is not None:
+                        items.append(i_value)
+                value = {first.tag: items}
+            values[id(element)] = value
+        return values[id(root)]
 
 
     def AsJson(self):
@@ -201,3 +334,17 @@ class XmlFactory(object):
         '''
         import json
         return json.dumps(self.AsDict())
+
+
+
+def _GetTextValue(element):
+    '''
+    :return unicode|None:
+        The value of an element without sub-elements in `XmlFactory.AsDict`.
+    '''
+    text = element.text
+    if text:
+        text = text.strip()
+        if text:
+            return text
+    return None